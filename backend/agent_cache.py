@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from telemetry import register_stats
+
+
+class AgentCache:
+    """
+    Bounded cache of per-session agents with LRU and idle-TTL eviction.
+
+    Parameters:
+    - max_entries: maximum number of agents kept in memory
+    - idle_ttl: seconds an agent may sit unused before it is dropped
+    """
+
+    def __init__(self, max_entries: int = 256, idle_ttl: float = 1800):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self._entries = OrderedDict()  # session_id -> (agent, last_used)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            agent, last_used = entry
+            if now - last_used > self.idle_ttl:
+                del self._entries[session_id]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries[session_id] = (agent, now)
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return agent
+
+    def put(self, session_id: str, agent) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries[session_id] = (agent, now)
+            self._entries.move_to_end(session_id)
+            self._expire(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, session_id: str):
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            return entry[0] if entry else None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def _expire(self, now: float) -> None:
+        # Entries are kept in last-used order, so stale ones sit at the front.
+        while self._entries:
+            session_id, (_, last_used) = next(iter(self._entries.items()))
+            if now - last_used <= self.idle_ttl:
+                break
+            del self._entries[session_id]
+            self.expirations += 1
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "idle_ttl": self.idle_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+agent_cache = AgentCache(
+    max_entries=int(os.getenv("AGENT_CACHE_MAX_ENTRIES", "256")),
+    idle_ttl=float(os.getenv("AGENT_CACHE_IDLE_TTL", "1800")),
+)
+register_stats("agent_cache", agent_cache.stats)
@@ -0,0 +1,77 @@
+"""
+FunctionTool wrappers the assistant agent calls. Kept apart from
+function_tools so the fast path and fallbacks can use the plain functions
+without importing autogen. Results go only to the model, so listings are
+rendered in TOOL_OUTPUT_FORMAT (compact JSON by default).
+"""
+from autogen_core.tools import FunctionTool
+
+from function_tools import (
+    store_user_outfit,
+    retrieve_user_outfit,
+    store_worn_outfits,
+    recently_worn_garments,
+    get_weather_by_coords,
+    save_outfit_feedback,
+    filter_outfits_by_feedback,
+    search_wardrobe_items,
+    recommend_outfits,
+    for_model,
+)
+from telemetry import timed_tool
+
+
+retrieve_outfit_tool = FunctionTool(
+    name="retrieve_user_outfit",
+    func=timed_tool("retrieve_user_outfit", for_model(retrieve_user_outfit)),
+    description="Retrieve already stored outfits of the given user, newest first. Results are paginated; pass page=2, 3, ... to see older outfits",
+)
+
+
+store_outfit_tool = FunctionTool(
+    name="store_user_outfit",
+    func=timed_tool("store_user_outfit", for_model(store_user_outfit)),
+    description="Store the uploaded outfit in MongoDB for a given user.",
+)
+
+store_worn_outfit_tool = FunctionTool(
+    name="store_worn_outfits",
+    func=timed_tool("store_worn_outfits", for_model(store_worn_outfits)),
+    description="Stores the user's worn outfit"
+)
+
+recently_worn_garments_tool = FunctionTool(
+    name="recently_worn_garments",
+    func=timed_tool("recently_worn_garments", for_model(recently_worn_garments)),
+    description="Garments the user wore in the past days, with when each was last worn and how often lately"
+)
+
+get_weather_tool = FunctionTool(
+    name="get_weather_tool",
+    func=timed_tool("get_weather_tool", for_model(get_weather_by_coords)),
+    description="returns the weather in degree celsius given the coordinates"
+)
+
+save_outfit_feedback_tool = FunctionTool(
+    name="save_outfit_feedback",
+    func=timed_tool("save_outfit_feedback", for_model(save_outfit_feedback)),
+    description="After suggesting outfit this tool saves the feedback from the user"
+)
+
+search_wardrobe_items_tool = FunctionTool(
+    name="search_wardrobe_items",
+    func=timed_tool("search_wardrobe_items", for_model(search_wardrobe_items)),
+    description="Search the user's wardrobe for individual garments by type, color, style, category or warmth (1-5)"
+)
+
+recommend_outfits_tool = FunctionTool(
+    name="recommend_outfits",
+    func=timed_tool("recommend_outfits", for_model(recommend_outfits)),
+    description="Returns the top ranked outfit candidates from the user's wardrobe, scored against weather, recent wear and feedback"
+)
+
+filter_outfits_by_feedback_tool = FunctionTool(
+    name="filter_outfits_by_feedback",
+    func=timed_tool("filter_outfits_by_feedback", for_model(filter_outfits_by_feedback)),
+    description="Retrieve outfits suggested to the user filtered by feedback type"
+)
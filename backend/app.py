@@ -1,24 +1,106 @@
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
+import concurrent.futures
 import os
+import json
+import logging
+import threading
 import jwt
 from datetime import datetime, timezone, timedelta
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
-from db import users_collection, sessions_collection
-from auth import token_required
-from assistant import create_agent
+from db import users_collection, sessions_collection, ensure_indexes
+from auth import token_required, invalidate_user
+from passwords import password_hasher, HashingBusy
 from bson import ObjectId
-import asyncio
+from pymongo.errors import DuplicateKeyError
+from event_loop import run_async, iterate_async, background_loop
+from chat_history import fetch_messages, delete_messages, clamp_limit
+from write_behind import write_behind
+import fast_path
+from semantic_cache import semantic_cache, fingerprint, WRITE_TOOLS
+from recommendation_context import wants_recommendation
+from function_tools import recommend_outfits
+from precompute import precomputed
+from state_store import forget_agent
+from wardrobe_import import import_rows, parse_upload
+import telemetry
 from dotenv import load_dotenv
 
+# The agent stack (autogen, the OpenAI client, the tools) is imported on
+# first use in the chat routes, or warmed up in the background after boot.
+
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}})
-app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+MODEL_TURN_TIMEOUT = float(os.getenv("MODEL_TURN_TIMEOUT", "60"))
+# Requests slower than this get their span breakdown logged as a warning
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "5"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+WARM_AGENT_STACK = os.getenv("WARM_AGENT_STACK", "1") == "1"
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+api = Blueprint("api", __name__)
+
+
+def log_trace(trace, elapsed):
+    if elapsed >= SLOW_REQUEST_SECONDS:
+        logger.warning("Slow request\n%s", trace.format())
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Request trace\n%s", trace.format())
+
+
+@api.before_app_request
+def start_trace():
+    g.trace = telemetry.Trace(f"{request.method} {request.path}")
+    g.trace_token = telemetry.current_trace.set(g.trace)
+
+
+@api.after_app_request
+def finish_trace(response):
+    # Streaming responses are timed to their first byte here; the stream
+    # itself is traced inside its generator.
+    trace = g.pop("trace", None)
+    if trace is not None:
+        elapsed = time.perf_counter() - trace.start
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        telemetry.http_requests.observe(
+            elapsed, request.method, endpoint, response.status_code
+        )
+        log_trace(trace, elapsed)
+    return response
 
 
-@app.route("/register", methods=["POST"])
+@api.teardown_app_request
+def end_trace(error=None):
+    token = g.pop("trace_token", None)
+    if token is not None:
+        telemetry.current_trace.reset(token)
+
+
+@api.route("/metrics", methods=["GET"])
+def metrics():
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"message": "Unauthorized"}), 401
+    body = telemetry.render_metrics()
+    return Response(body, mimetype="text/plain; version=0.0.4")
+
+
+def busy():
+    response = jsonify({"message": "Server busy, please retry shortly"})
+    response.headers["Retry-After"] = "1"
+    return response, 503
+
+
+@api.route("/register", methods=["POST"])
 def register():
     data = request.get_json()
 
@@ -31,37 +113,121 @@ def register():
     ):
         return jsonify({"message": "Username or e-mail already exists"}), 400
 
-    hashed = generate_password_hash(data["password"])
-    users_collection.insert_one(
-        {
-            "username": data["username"],
-            "email": data["email"],
-            "password": hashed,
-            "created": datetime.now(timezone.utc),
-        }
-    )
+    try:
+        hashed = password_hasher.hash(data["password"])
+    except HashingBusy:
+        return busy()
+    try:
+        users_collection.insert_one(
+            {
+                "username": data["username"],
+                "email": data["email"],
+                "password": hashed,
+                "created": datetime.now(timezone.utc),
+            }
+        )
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration (unique indexes)
+        return jsonify({"message": "Username or e-mail already exists"}), 400
+    invalidate_user(data["username"])
     return jsonify({"message": "User registered successfully"}), 201
 
 
-@app.route("/login", methods=["POST"])
+@api.route("/login", methods=["POST"])
 def login():
     data = request.get_json()
     if not data or not data.get("username") or not data.get("password"):
         return jsonify({"message": "Missing username or password"}), 400
-    user = users_collection.find_one({"username": data["username"]})
-    if not user or not check_password_hash(user["password"], data["password"]):
+    user = users_collection.find_one(
+        {"username": data["username"]}, {"username": 1, "password": 1}
+    )
+    try:
+        valid = user is not None and password_hasher.verify(user["password"], data["password"])
+    except HashingBusy:
+        return busy()
+    if not valid:
         return jsonify({"message": "Invalid username or password"}), 401
+    if password_hasher.needs_rehash(user["password"]):
+        # Hash parameters changed; upgrade the stored hash off the request path
+        password_hasher.rehash_later(
+            data["password"],
+            lambda hashed: users_collection.update_one(
+                {"_id": user["_id"], "password": user["password"]},
+                {"$set": {"password": hashed}},
+            ),
+        )
     token = jwt.encode(
         {
             "username": user["username"],
             "exp": datetime.now(timezone.utc) + timedelta(hours=24),
         },
-        app.config["SECRET_KEY"],
+        current_app.config["SECRET_KEY"],
     )
     return jsonify({"token": token})
 
 
-@app.route("/chat", methods=["POST"])
+def create_session(username):
+    session = {
+        "user_id": username,
+        "created_at": datetime.now(timezone.utc),
+        "message_count": 0,
+    }
+    return str(write_behind.insert("chat_sessions", session))
+
+
+def save_turn(session_id, user_input, response):
+    write_behind.append_messages(
+        session_id,
+        [
+            {"role": "user", "content": user_input},
+            {"role": "assistant", "content": response},
+        ],
+    )
+    from session_memory import update_summary
+
+    # Fold older turns into the rolling summary off the request path
+    background_loop.submit(update_summary(session_id))
+
+
+def serialize_messages(messages):
+    for message in messages:
+        message["timestamp"] = message["timestamp"].isoformat()
+    return messages
+
+
+def answer_without_model(session_id, username, user_input, location, state):
+    response = fast_path.answer(username, user_input)
+    if response is None:
+        response = precomputed.answer(username, user_input, location)
+    if response is None and state is not None and wants_recommendation(user_input):
+        response = semantic_cache.get(username, user_input, state)
+    if response is not None:
+        # The cached agent never saw this exchange; rebuild it from history
+        forget_agent(session_id)
+    return response
+
+
+def remember_reply(username, user_input, state, response, tools_used):
+    if state is not None and wants_recommendation(user_input) and not tools_used & WRITE_TOOLS:
+        semantic_cache.put(username, user_input, state, response)
+
+
+def local_reply(username, user_input, location):
+    """Answer a recommendation request without the model, or None for other requests."""
+    if not wants_recommendation(user_input):
+        return None
+    response = precomputed.lookup(username, location)
+    if response is None:
+        location = location or {}
+        response = recommend_outfits(username, location.get("latitude"), location.get("longitude"))
+    return response
+
+
+def sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+@api.route("/chat", methods=["POST"])
 @token_required
 def chat(current_user):
     data = request.get_json()
@@ -72,48 +238,135 @@ def chat(current_user):
     session_id = data.get("session_id")
 
     # Create new session if none provided
-    if not session_id:
-        session = {
-            "user_id": current_user["username"],
-            "created_at": datetime.now(timezone.utc),
-            "messages": [],
-        }
-        result = sessions_collection.insert_one(session)
-        session_id = str(result.inserted_id)
+    opening = not session_id
+    if opening:
+        session_id = create_session(current_user["username"])
 
-    # Get or create agent for this session
-    agent = create_agent(session_id, data["location"])
+    location = data.get("location")
+    precomputed.remember_location(current_user["username"], location)
 
-    # Run the agent asynchronously
-    result = asyncio.run(agent.run(task=user_input))
+    # Plain reads, precomputed picks and repeat questions skip the model
+    # entirely; cached replies only answer a session's opening question
+    state = fingerprint(current_user["username"], location) if opening else None
+    response = answer_without_model(
+        session_id, current_user["username"], user_input, location, state
+    )
+    if response is not None:
+        save_turn(session_id, user_input, response)
+        return jsonify({"response": response, "session_id": session_id})
+
+    # Get or create the session's agent and run it on the shared event loop
+    from assistant import run_turn, tool_names
+
+    try:
+        result = run_async(
+            run_turn(session_id, current_user["username"], user_input, location),
+            timeout=MODEL_TURN_TIMEOUT,
+        )
+        logger.debug("Agent turn messages: %s", result.messages)
+        response = result.messages[-1].content
+        remember_reply(
+            current_user["username"], user_input, state, response,
+            tool_names(result.messages),
+        )
+    except Exception as e:
+        # Model slow or down: answer recommendation requests locally
+        response = local_reply(current_user["username"], user_input, location)
+        if response is None:
+            raise
+        logger.warning("Agent turn failed, using local recommendations: %s", e)
 
     # Store the message in session history
-    sessions_collection.update_one(
-        {"_id": ObjectId(session_id)},
-        {
-            "$push": {
-                "messages": {
-                    "$each": [
-                        {
-                            "role": "user",
-                            "content": user_input,
-                            "timestamp": datetime.now(timezone.utc),
-                        },
-                        {
-                            "role": "assistant",
-                            "content": result.messages[-1].content,
-                            "timestamp": datetime.now(timezone.utc),
-                        },
-                    ]
-                }
-            }
-        },
+    save_turn(session_id, user_input, response)
+    return jsonify({"response": response, "session_id": session_id})
+
+
+@api.route("/chat/stream", methods=["POST"])
+@token_required
+def chat_stream(current_user):
+    data = request.get_json()
+    if not data or not data.get("message"):
+        return jsonify({"message": "Missing message"}), 400
+
+    user_input = data["message"]
+    session_id = data.get("session_id")
+    location = data.get("location")
+    username = current_user["username"]
+
+    opening = not session_id
+    if opening:
+        session_id = create_session(username)
+    precomputed.remember_location(username, location)
+
+    def generate():
+        yield sse("session", {"session_id": session_id})
+        with telemetry.trace("POST /chat/stream (stream)") as trace:
+            try:
+                state = fingerprint(username, location) if opening else None
+                response = answer_without_model(
+                    session_id, username, user_input, location, state
+                )
+                if response is not None:
+                    save_turn(session_id, user_input, response)
+                    yield sse("done", {"response": response, "session_id": session_id})
+                    return
+
+                from assistant import stream_turn
+
+                tools_used = set()
+                try:
+                    # Cancelling the turn on timeout also discards the session's agent
+                    for event, payload in iterate_async(
+                        stream_turn(session_id, username, user_input, location),
+                        timeout=MODEL_TURN_TIMEOUT,
+                    ):
+                        if event == "tool_call":
+                            tools_used.add(payload["name"])
+                        elif event == "done":
+                            save_turn(session_id, user_input, payload["response"])
+                            remember_reply(
+                                username, user_input, state, payload["response"], tools_used
+                            )
+                            payload["session_id"] = session_id
+                        yield sse(event, payload)
+                except concurrent.futures.TimeoutError:
+                    # Model too slow: answer recommendation requests locally, as /chat does
+                    response = local_reply(username, user_input, location)
+                    if response is None:
+                        raise
+                    logger.warning("Streaming agent turn timed out, using local recommendations")
+                    save_turn(session_id, user_input, response)
+                    yield sse("done", {"response": response, "session_id": session_id})
+            except Exception:
+                logger.exception("Streaming chat failed")
+                yield sse("error", {"message": "Error processing your message"})
+            finally:
+                log_trace(trace, time.perf_counter() - trace.start)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    print(result.messages)
-    return jsonify({"response": result.messages[-1].content, "session_id": session_id})
 
 
-@app.route("/validate-token", methods=["GET"])
+@api.route("/wardrobe/import", methods=["POST"])
+@token_required
+def import_wardrobe(current_user):
+    """
+    Bulk-add garments from an NDJSON (default) or CSV body, streamed in.
+    Responds with NDJSON progress lines and a final summary with per-row errors.
+    """
+    rows = parse_upload(request.stream, request.content_type)
+
+    def generate():
+        for event in import_rows(current_user["username"], rows):
+            yield json.dumps(event) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@api.route("/validate-token", methods=["GET"])
 @token_required
 def validate_token(current_user):
     return (
@@ -122,12 +375,13 @@ def validate_token(current_user):
     )
 
 
-@app.route("/sessions", methods=["GET"])
+@api.route("/sessions", methods=["GET"])
 @token_required
 def get_sessions(current_user):
     sessions = list(
         sessions_collection.find(
-            {"user_id": current_user["username"]}, {"messages": 0}  # Exclude messages
+            {"user_id": current_user["username"]},
+            {"user_id": 1, "created_at": 1, "message_count": 1},
         ).sort("created_at", -1)
     )
 
@@ -138,24 +392,46 @@ def get_sessions(current_user):
     return jsonify(sessions), 200
 
 
-@app.route("/sessions/<session_id>", methods=["GET"])
+def find_user_session(session_id, username):
+    return sessions_collection.find_one(
+        {"_id": ObjectId(session_id), "user_id": username},
+        {"user_id": 1, "created_at": 1, "message_count": 1},
+    )
+
+
+@api.route("/sessions/<session_id>", methods=["GET"])
 @token_required
 def get_session(current_user, session_id):
-    session = sessions_collection.find_one(
-        {"_id": ObjectId(session_id), "user_id": current_user["username"]}
-    )
+    session = find_user_session(session_id, current_user["username"])
 
     if not session:
         return jsonify({"message": "Session not found"}), 404
 
+    # Only the newest page of messages; older ones via /sessions/<id>/messages
+    messages, cursor = fetch_messages(
+        session_id, limit=clamp_limit(request.args.get("limit"))
+    )
     session["_id"] = str(session["_id"])
     session["created_at"] = session["created_at"].isoformat()
-    for message in session["messages"]:
-        message["timestamp"] = message["timestamp"].isoformat()
+    session["messages"] = serialize_messages(messages)
+    session["next_before"] = cursor
     return jsonify(session), 200
 
 
-@app.route("/sessions/<session_id>", methods=["DELETE"])
+@api.route("/sessions/<session_id>/messages", methods=["GET"])
+@token_required
+def get_session_messages(current_user, session_id):
+    if not find_user_session(session_id, current_user["username"]):
+        return jsonify({"message": "Session not found"}), 404
+
+    before = request.args.get("before", type=int)
+    messages, cursor = fetch_messages(
+        session_id, before=before, limit=clamp_limit(request.args.get("limit"))
+    )
+    return jsonify({"messages": serialize_messages(messages), "next_before": cursor}), 200
+
+
+@api.route("/sessions/<session_id>", methods=["DELETE"])
 @token_required
 def delete_session(current_user, session_id):
     result = sessions_collection.delete_one({
@@ -165,9 +441,59 @@ def delete_session(current_user, session_id):
     
     if result.deleted_count == 0:
         return jsonify({"message": "Session not found"}), 404
-    
+
+    delete_messages(session_id)
+    forget_agent(session_id)
     return jsonify({"message": "Session deleted successfully"}), 204
 
 
+def ensure_indexes_in_background():
+    def run():
+        try:
+            ensure_indexes()
+        except Exception:
+            logger.exception("Failed to ensure MongoDB indexes")
+
+    threading.Thread(target=run, name="ensure-indexes", daemon=True).start()
+
+
+def warm_agent_stack():
+    """Import the agent modules off the request path so the first turn doesn't pay for it."""
+    def run():
+        start = time.perf_counter()
+        import assistant  # noqa: F401
+        telemetry.startup["agent_stack_seconds"] = time.perf_counter() - start
+        logger.info("Agent stack loaded in %.3fs", telemetry.startup["agent_stack_seconds"])
+
+    threading.Thread(target=run, name="warm-agent-stack", daemon=True).start()
+
+
+def create_app() -> Flask:
+    """
+    Build the Flask app. Nothing here waits on MongoDB or the model API:
+    the Mongo client connects on first use, indexes are ensured and the
+    agent stack is imported on background threads.
+    """
+    start = time.perf_counter()
+    app = Flask(__name__)
+    CORS(app, resources={r"/*": {"origins": "*"}})
+    app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
+    app.register_blueprint(api)
+
+    ensure_indexes_in_background()
+    write_behind.start()
+    if WARM_AGENT_STACK:
+        warm_agent_stack()
+
+    setup_seconds = time.perf_counter() - start
+    telemetry.startup.update(imports_seconds=IMPORT_SECONDS, setup_seconds=setup_seconds)
+    logger.info(
+        "Started in %.3fs (imports %.3fs, app setup %.3fs)",
+        IMPORT_SECONDS + setup_seconds, IMPORT_SECONDS, setup_seconds,
+    )
+    return app
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    # Development server only; production runs under gunicorn (gunicorn.conf.py)
+    create_app().run(debug=os.getenv("FLASK_DEBUG") == "1")
@@ -1,60 +1,90 @@
 from autogen_agentchat.agents import AssistantAgent
+from autogen_agentchat.base import TaskResult
+from autogen_agentchat.messages import (
+                                ModelClientStreamingChunkEvent,
+                                ToolCallExecutionEvent,
+                                ToolCallRequestEvent,
+                            )
 from model_client import model_client
-from function_tools import (
+from agent_tools import (
                                 store_outfit_tool, 
                                 retrieve_outfit_tool, 
-                                retrieve_recent_outfit_tool, 
+                                recently_worn_garments_tool,
                                 store_worn_outfit_tool,
                                 get_weather_tool,
                                 save_outfit_feedback_tool,
-                                filter_outfits_by_feedback_tool
+                                filter_outfits_by_feedback_tool,
+                                search_wardrobe_items_tool,
+                                recommend_outfits_tool,
+                            )
+from recommendation_context import with_recommendation_context
+from session_memory import (
+                                BoundedChatCompletionContext,
+                                SessionHistoryMemory,
+                                budget_history,
+                                load_session_history,
                             )
-from autogen_core.memory import MemoryContent, ListMemory
-from db import sessions_collection
-from bson import ObjectId
-from typing import Optional, Dict, Any
+from agent_cache import agent_cache
+from state_store import agent_states, forget_agent, SHARED
+from telemetry import span
+from typing import Optional, Dict, Any, Tuple
 import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
 
 def load_system_message(path: str) -> str:
     with open(path, "r", encoding="utf-8") as message:
         return message.read()
 
 
-SYSTEM_MESSAGE = load_system_message("prompts/system_message.txt")
+SYSTEM_MESSAGE = load_system_message(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts", "system_message.txt")
+)
 
-# Dictionary to store active agents
-active_agents = {}
+# Messages the agent keeps in its own model context between turns
+CONTEXT_BUFFER_SIZE = int(os.getenv("AGENT_CONTEXT_BUFFER_SIZE", "20"))
 
 
-
-def create_agent(session_id: str,
-                 location: Optional[Dict[str, Any]] = None) -> AssistantAgent:
+async def create_agent(session_id: str,
+                       username: str,
+                       location: Optional[Dict[str, Any]] = None
+                       ) -> Tuple[AssistantAgent, Optional[int]]:
     """
     Create or retrieve an agent for a specific session.
 
+    Agents are kept in a bounded LRU cache. With a shared state store a
+    cached agent is only reused if no other worker has saved a newer state;
+    otherwise the agent is restored from the stored state, or rebuilt from
+    the session history stored in ``chat_messages``.
+
     Args:
         session_id: The ID of the chat session
+        username:   Owner of the session
         location:   Dict with "latitude" and "longitude" (may be None)
+
+    Returns:
+        (agent, state version) — pass the version to ``save_agent``
     """
-    if session_id in active_agents:
-        return active_agents[session_id]
-    
-    print(location)
-    # Fetch session history
-    session = sessions_collection.find_one({"_id": ObjectId(session_id)})
-    memory = ListMemory()
-
-    async def add_memory():
-        if session and "messages" in session:
-            for msg in sorted(session["messages"],
-                              key=lambda m: m.get("timestamp", ""))[-15:]:
-                await memory.add(
-                    MemoryContent(
-                        role=msg["role"],
-                        content=msg["content"],
-                        mime_type="text/plain",
-                    )
-                )
+    cached = agent_cache.get(session_id)
+    if cached is not None:
+        if not SHARED:
+            return cached
+        if await asyncio.to_thread(agent_states.version, session_id) == cached[1]:
+            return cached
+
+    logger.debug("Building agent for session %s (location %s)", session_id, location)
+    with span("agent.load_state"):
+        state, version = await asyncio.to_thread(agent_states.load, session_id)
+    if state is None:
+        # Fetch the summary and the newest messages that fit the token budget
+        with span("agent.load_history"):
+            session = await asyncio.to_thread(load_session_history, session_id)
+        memory = SessionHistoryMemory(session_id, budget_history(session))
+    else:
+        # The restored model context already holds the earlier turns
+        memory = SessionHistoryMemory(session_id, [])
 
     # ---- Build the personalized system prompt ----
     coords_txt = ""
@@ -66,26 +96,22 @@ def create_agent(session_id: str,
         )
 
     personalized_message = (
-        f"You are assisting a user with username: '{session['user_id']}'"
+        f"You are assisting a user with username: '{username}'"
         f"{coords_txt}.\n\n"
         f"{SYSTEM_MESSAGE}\n\n"
-        "IMPORTANT: Always check the conversation history in your memory before responding. "
-        "Your responses should be contextual and reference previous messages when relevant. "
-        "If a user asks about something that was discussed before, use that context in your response. "
-        "When responding, first check your memory for relevant previous messages and incorporate that context into your response."
+        "Use the earlier conversation in your memory when it is relevant."
     )
 
-    # Run the async function to add memory
-    asyncio.run(add_memory())
-
     func_tools = [
         store_outfit_tool,
         retrieve_outfit_tool,
-        retrieve_recent_outfit_tool,
+        recently_worn_garments_tool,
         store_worn_outfit_tool,
         get_weather_tool,
         save_outfit_feedback_tool,
         filter_outfits_by_feedback_tool,
+        search_wardrobe_items_tool,
+        recommend_outfits_tool,
     ]
 
     agent = AssistantAgent(
@@ -93,9 +119,128 @@ def create_agent(session_id: str,
         model_client=model_client,
         tools=func_tools,
         reflect_on_tool_use=True,
+        model_client_stream=True,
         system_message=personalized_message,
-        memory=[memory]
+        memory=[memory],
+        model_context=BoundedChatCompletionContext(buffer_size=CONTEXT_BUFFER_SIZE),
     )
+    if state is not None:
+        await agent.load_state(state)
+
+    agent_cache.put(session_id, (agent, version))
+    return agent, version
+
+
+async def save_agent(session_id: str, agent: AssistantAgent, version: Optional[int]) -> None:
+    """
+    Store the agent's state after a turn so any worker can continue the
+    session. If another worker saved first, the local copy is dropped and
+    the next turn starts from the stored state.
+    """
+    if not SHARED:
+        return
+    state = await agent.save_state()
+    with span("agent.save_state"):
+        saved = await asyncio.to_thread(agent_states.save, session_id, state, version)
+    if saved is None:
+        agent_cache.pop(session_id)
+    else:
+        agent_cache.put(session_id, (agent, saved))
+
+
+async def discard_agent(session_id: str) -> None:
+    """
+    Drop the session's agent after a failed, timed out or cancelled run:
+    its context may end in the middle of a tool call, which the model API
+    rejects on the next turn.
+    """
+    await asyncio.to_thread(forget_agent, session_id)
 
-    active_agents[session_id] = agent
-    return agent
+
+async def prepare_turn(session_id: str,
+                       username: str,
+                       task: str,
+                       location: Optional[Dict[str, Any]] = None):
+    """
+    Load the session's agent and, for recommendation requests, prefetch the
+    wardrobe/recent-outfit/weather context concurrently with it.
+
+    Returns:
+        (agent, version, task) with the context prepended to the task when fetched
+    """
+    with span("agent.prepare"):
+        (agent, version), task = await asyncio.gather(
+            create_agent(session_id, username, location),
+            with_recommendation_context(task, username, location),
+        )
+    return agent, version, task
+
+
+async def run_turn(session_id: str,
+                   username: str,
+                   task: str,
+                   location: Optional[Dict[str, Any]] = None):
+    """
+    Run one chat turn for a session on the caller's event loop.
+
+    Returns:
+        TaskResult of the agent run
+    """
+    try:
+        agent, version, task = await prepare_turn(session_id, username, task, location)
+        with span("agent.run"):
+            result = await agent.run(task=task)
+    except BaseException:
+        await discard_agent(session_id)
+        raise
+    await save_agent(session_id, agent, version)
+    return result
+
+
+def tool_names(messages) -> set:
+    """Names of the tools the agent called in a run's messages."""
+    return {
+        call.name
+        for message in messages
+        if isinstance(message, ToolCallRequestEvent)
+        for call in message.content
+    }
+
+
+async def stream_turn(session_id: str,
+                      username: str,
+                      task: str,
+                      location: Optional[Dict[str, Any]] = None):
+    """
+    Run one chat turn and yield progress as ``(event, payload)`` pairs.
+
+    Events:
+        "tool_call":   a tool the model decided to call
+        "tool_result": a tool finished (is_error flags failures)
+        "token":       a streamed chunk of model output
+        "done":        the final assistant response
+    """
+    saved = False
+    try:
+        agent, version, task = await prepare_turn(session_id, username, task, location)
+        async for event in agent.run_stream(task=task):
+            if isinstance(event, ModelClientStreamingChunkEvent):
+                yield "token", {"content": event.content}
+            elif isinstance(event, ToolCallRequestEvent):
+                for call in event.content:
+                    yield "tool_call", {"name": call.name}
+            elif isinstance(event, ToolCallExecutionEvent):
+                for result in event.content:
+                    yield "tool_result", {
+                        "name": getattr(result, "name", None),
+                        "is_error": bool(result.is_error),
+                    }
+            elif isinstance(event, TaskResult):
+                await save_agent(session_id, agent, version)
+                saved = True
+                yield "done", {"response": event.messages[-1].content}
+    except BaseException:
+        # Also on client disconnect (the pump task is cancelled)
+        if not saved:
+            await discard_agent(session_id)
+        raise
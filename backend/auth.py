@@ -3,9 +3,73 @@ from flask import request, jsonify
 import jwt
 from db import users_collection
 import os
+import threading
+import time
 from dotenv import load_dotenv
 load_dotenv()
 
+SECRET_KEY = os.getenv("SECRET_KEY")
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+# Only these fields are handed to route handlers
+PRINCIPAL_PROJECTION = {"_id": 0, "username": 1, "email": 1}
+
+
+class UserCache:
+    """Short-TTL cache of user principals keyed by username."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}  # username -> (principal, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[username]
+                return None
+            return entry[0]
+
+    def put(self, username, principal):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                now = time.monotonic()
+                self._entries = {
+                    k: v for k, v in self._entries.items() if v[1] > now
+                }
+                if len(self._entries) >= self.max_entries:
+                    self._entries.pop(next(iter(self._entries)))
+            self._entries[username] = (principal, time.monotonic() + self.ttl)
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+
+user_cache = UserCache(USER_CACHE_TTL, USER_CACHE_MAX_ENTRIES)
+
+
+def invalidate_user(username):
+    """Drop a cached principal; call after changing or deleting a user."""
+    user_cache.invalidate(username)
+
+
+def load_principal(username):
+    principal = user_cache.get(username)
+    if principal is None:
+        principal = users_collection.find_one(
+            {"username": username}, PRINCIPAL_PROJECTION
+        )
+        if principal:
+            user_cache.put(username, principal)
+    return principal
+
+
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
@@ -14,8 +78,8 @@ def token_required(f):
             return jsonify({"message": "Token is missing!"}), 401
         try:
             token = token.split(" ")[1]
-            data = jwt.decode(token, os.getenv("SECRET_KEY"), algorithms=["HS256"])
-            current_user = users_collection.find_one({"username": data["username"]})
+            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+            current_user = load_principal(data["username"])
             if not current_user:
                 return jsonify({"message": "Invalid token!"}), 401
         except Exception as e:
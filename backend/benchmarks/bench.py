@@ -0,0 +1,359 @@
+"""
+Load test and latency benchmark for the backend.
+
+Starts the Flask app in-process behind a threaded WSGI server, with a fake
+OpenAI-compatible model server (scripted tool calls), a fake OpenWeatherMap
+server and either mongomock or a throwaway database on a real mongod. Virtual
+users register, log in, chat and page through their sessions concurrently;
+afterwards every FunctionTool is timed directly. Reports throughput and
+p50/p95/p99 per endpoint, per chat scenario and per tool.
+
+Usage (from backend/):
+    python -m benchmarks.bench --users 20 --concurrency 8
+    python -m benchmarks.bench --save-baseline benchmarks/baseline.json
+    python -m benchmarks.bench --compare benchmarks/baseline.json --tolerance 0.2
+    python -m benchmarks.bench --tool-output prose   # vs. the compact default
+
+With --compare the exit status is 1 when any p95/p99 or the overall
+throughput regressed by more than the tolerance.
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.fakes import FakeOpenAIServer, FakeWeatherServer
+
+# Messages are chosen to hit each path the fake model scripts (see fakes._script)
+CHAT_SCRIPT = [
+    ("chat:fast_path", "show my wardrobe"),
+    ("chat:store_user_outfit", "I bought a navy denim jacket and beige chinos, add them"),
+    ("chat:recommend_outfits", "What should I wear today?"),
+    ("chat:store_worn_outfits", "I wore my red hoodie and black jeans yesterday"),
+    ("chat:recommend_outfits", "what should i wear today"),
+    ("chat:filter_outfits_by_feedback", "Which of my outfits have I liked so far?"),
+    ("chat:fast_path", "what did i wear recently"),
+    ("chat:text", "thanks!"),
+]
+LOCATION = {"latitude": 52.5200, "longitude": 13.4050}
+
+# Absolute slack (seconds) so tiny latencies don't flag noise as regressions
+MIN_REGRESSION_DELTA = 0.005
+
+
+def percentile(samples, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not samples:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(samples)))
+    return samples[rank - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def observe(self, name, seconds, ok=True):
+        with self._lock:
+            self.samples[name].append(seconds)
+            if not ok:
+                self.errors[name] += 1
+
+    def timed(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = getattr(result, "ok", True)
+            return result
+        finally:
+            self.observe(name, time.perf_counter() - start, ok)
+
+    def summary(self, elapsed):
+        report = {}
+        for name in sorted(self.samples):
+            samples = sorted(self.samples[name])
+            report[name] = {
+                "count": len(samples),
+                "errors": self.errors[name],
+                "throughput": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+                "p50": round(percentile(samples, 50), 4),
+                "p95": round(percentile(samples, 95), 4),
+                "p99": round(percentile(samples, 99), 4),
+            }
+        return report
+
+
+def configure_environment(args, model_url, weather_url):
+    """Point the app at the fakes; must run before the app is imported."""
+    os.environ.update({
+        "OPENAI_BASE_URL": model_url,
+        "OPENAI_API_KEY": "bench",
+        "OPENWEATHERMAP_URL": weather_url,
+        "OPENWEATHERMAP_API_KEY": "bench",
+        "SECRET_KEY": os.getenv("SECRET_KEY", "bench-secret"),
+        "MONGO_DB": args.mongo_db,
+        "MODEL_RETRY_BASE_DELAY": "0.05",
+        "TOOL_OUTPUT_FORMAT": args.tool_output,
+    })
+    if args.mongo_uri:
+        os.environ["MONGO_URI"] = args.mongo_uri
+        import pymongo
+        pymongo.MongoClient(args.mongo_uri).drop_database(args.mongo_db)
+    else:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    if args.journal:
+        os.environ["WRITE_BEHIND_JOURNAL"] = os.path.join(
+            tempfile.mkdtemp(prefix="bench-"), "write_behind.journal"
+        )
+
+
+def serve(app):
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def virtual_user(base_url, recorder, iterations, stream):
+    """One user's session: register, log in, chat through the script, browse sessions."""
+    http = requests.Session()
+    name = f"bench_{uuid.uuid4().hex[:10]}"
+    credentials = {"username": name, "password": "bench-password", "email": f"{name}@example.com"}
+
+    recorder.timed("POST /register", http.post, f"{base_url}/register", json=credentials)
+    reply = recorder.timed("POST /login", http.post, f"{base_url}/login", json=credentials)
+    if not reply.ok:
+        return
+    http.headers["Authorization"] = f"Bearer {reply.json()['token']}"
+
+    chat_path = "/chat/stream" if stream else "/chat"
+    session_id = None
+    for _ in range(iterations):
+        for scenario, message in CHAT_SCRIPT:
+            body = {"message": message, "location": LOCATION}
+            if session_id:
+                body["session_id"] = session_id
+            start = time.perf_counter()
+            reply = http.post(f"{base_url}{chat_path}", json=body, stream=stream)
+            ok = reply.ok
+            if stream and ok:
+                for line in reply.iter_lines(decode_unicode=True):
+                    if line.startswith("event: error"):
+                        ok = False
+                    elif line.startswith("data: ") and session_id is None:
+                        session_id = json.loads(line[6:]).get("session_id")
+            elif ok:
+                session_id = reply.json().get("session_id")
+            elapsed = time.perf_counter() - start
+            recorder.observe(f"POST {chat_path}", elapsed, ok)
+            recorder.observe(scenario, elapsed, ok)
+
+    recorder.timed("GET /sessions", http.get, f"{base_url}/sessions")
+    if session_id:
+        reply = recorder.timed(
+            "GET /sessions/<id>", http.get, f"{base_url}/sessions/{session_id}"
+        )
+        cursor = reply.json().get("next_before") if reply.ok else None
+        if cursor:
+            recorder.timed(
+                "GET /sessions/<id>/messages", http.get,
+                f"{base_url}/sessions/{session_id}/messages", params={"before": cursor},
+            )
+
+
+def benchmark_tools(recorder, usernames, repeat, concurrency):
+    """Time each FunctionTool's underlying function directly."""
+    import function_tools as tools
+
+    calls = {
+        "retrieve_user_outfit": lambda u: tools.retrieve_user_outfit(u),
+        "retrieve_recent_outfits": lambda u: tools.retrieve_recent_outfits(u, 30),
+        "recently_worn_garments": lambda u: tools.recently_worn_garments(u, 30),
+        "filter_outfits_by_feedback": lambda u: tools.filter_outfits_by_feedback(u, "like"),
+        "search_wardrobe_items": lambda u: tools.search_wardrobe_items(u, color="navy"),
+        "recommend_outfits": lambda u: tools.recommend_outfits(
+            u, LOCATION["latitude"], LOCATION["longitude"]
+        ),
+        "get_weather_by_coords": lambda u: tools.get_weather_by_coords(
+            LOCATION["latitude"], LOCATION["longitude"]
+        ),
+        "store_user_outfit": lambda u: tools.store_user_outfit(
+            u, [{"type": "scarf", "color": "grey", "style": "wool"}]
+        ),
+        "store_worn_outfits": lambda u: tools.store_worn_outfits(
+            u, [[{"type": "t-shirt", "color": "white"}]]
+        ),
+        "save_outfit_feedback": lambda u: tools.save_outfit_feedback(
+            u, [{"type": "t-shirt", "color": "white"}], "like"
+        ),
+    }
+    # Render the way the agent sees the results (--tool-output)
+    calls = {name: tools.for_model(call) for name, call in calls.items()}
+    jobs = [(name, user) for name in calls for user in usernames for _ in range(repeat)]
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [
+            pool.submit(recorder.timed, f"tool:{name}", calls[name], user)
+            for name, user in jobs
+        ]:
+            future.result()
+
+
+def compare(report, baseline, tolerance):
+    """Return a list of human-readable regressions against a stored baseline."""
+    regressions = []
+    for name, base in baseline["endpoints"].items():
+        current = report["endpoints"].get(name)
+        if current is None:
+            regressions.append(f"{name}: missing from this run")
+            continue
+        for stat in ("p95", "p99"):
+            limit = base[stat] * (1 + tolerance) + MIN_REGRESSION_DELTA
+            if current[stat] > limit:
+                regressions.append(
+                    f"{name}: {stat} {current[stat] * 1000:.1f}ms > "
+                    f"{base[stat] * 1000:.1f}ms baseline"
+                )
+        base_rate = base["errors"] / base["count"] if base["count"] else 0.0
+        rate = current["errors"] / current["count"] if current["count"] else 0.0
+        if rate > base_rate + tolerance / 10:
+            regressions.append(f"{name}: error rate {rate:.1%} > {base_rate:.1%} baseline")
+    if report["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(
+            f"throughput {report['throughput']:.1f} req/s < "
+            f"{baseline['throughput']:.1f} req/s baseline"
+        )
+    return regressions
+
+
+def print_report(report):
+    print(f"\n{'name':<40} {'count':>6} {'err':>4} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, row in report["endpoints"].items():
+        print(f"{name:<40} {row['count']:>6} {row['errors']:>4} {row['throughput']:>8.1f} "
+              f"{row['p50'] * 1000:>8.1f} {row['p95'] * 1000:>8.1f} {row['p99'] * 1000:>8.1f}")
+    print(f"\nHTTP throughput: {report['throughput']:.1f} req/s "
+          f"over {report['elapsed']:.1f}s")
+    for name, stats in report["backend"].items():
+        print(f"{name}: {stats}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=20, help="virtual users")
+    parser.add_argument("--concurrency", type=int, default=8, help="users running at once")
+    parser.add_argument("--iterations", type=int, default=1, help="chat script passes per user")
+    parser.add_argument("--stream", action="store_true", help="use /chat/stream instead of /chat")
+    parser.add_argument("--tool-repeat", type=int, default=3, help="direct calls per tool per user")
+    parser.add_argument("--model-latency", type=float, default=0.05,
+                        help="seconds the fake model waits before answering")
+    parser.add_argument("--weather-latency", type=float, default=0.02,
+                        help="seconds the fake weather API waits before answering")
+    parser.add_argument("--mongo-uri", help="real mongod to use instead of mongomock")
+    parser.add_argument("--mongo-db", default="outfit_bench",
+                        help="database name (dropped first when --mongo-uri is set)")
+    parser.add_argument("--journal", action="store_true", help="enable the write-behind journal")
+    parser.add_argument("--tool-output", choices=("compact", "prose"), default="compact",
+                        help="how tool results are rendered for the model")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed relative slowdown when comparing")
+    args = parser.parse_args(argv)
+
+    model = FakeOpenAIServer(latency=args.model_latency).start()
+    weather = FakeWeatherServer(latency=args.weather_latency).start()
+    configure_environment(args, model.base_url, weather.url)
+
+    from app import create_app
+    from agent_cache import agent_cache
+    from model_client import model_client
+    from response_cache import response_cache
+    from semantic_cache import semantic_cache
+    from telemetry import tool_output_tokens
+    from weather import weather_service
+    from write_behind import write_behind
+
+    server, base_url = serve(create_app())
+    recorder = Recorder()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for future in [
+            pool.submit(virtual_user, base_url, recorder, args.iterations, args.stream)
+            for _ in range(args.users)
+        ]:
+            future.result()
+    elapsed = time.perf_counter() - start
+    http_requests = sum(
+        len(samples) for name, samples in recorder.samples.items() if " /" in name
+    )
+    write_behind.flush(10)
+
+    tool_users = [f"bench_tools_{i}" for i in range(max(1, args.concurrency))]
+    benchmark_tools(recorder, tool_users, args.tool_repeat, args.concurrency)
+    write_behind.flush(10)
+
+    report = {
+        "config": {
+            key: getattr(args, key)
+            for key in ("users", "concurrency", "iterations", "stream", "tool_repeat",
+                        "model_latency", "weather_latency", "tool_output")
+        },
+        "elapsed": round(elapsed, 3),
+        "throughput": round(http_requests / elapsed, 2) if elapsed else 0.0,
+        "endpoints": recorder.summary(elapsed),
+        "backend": {
+            "model": model_client.stats(),
+            "agent_cache": agent_cache.stats(),
+            "weather_cache": weather_service.stats(),
+            "weather_api_requests": weather.requests,
+            "response_cache": response_cache.stats(),
+            "semantic_cache": semantic_cache.stats(),
+            "write_behind": write_behind.stats(),
+            "tool_output_tokens": {
+                tool: totals for (tool,), totals in sorted(tool_output_tokens.totals().items())
+            },
+        },
+    }
+    server.shutdown()
+    model.stop()
+    weather.stop()
+    print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("\n⚠️ Baseline was recorded with a different configuration")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print("\n❌ Regressions:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("\n✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Local stand-ins for the external services the backend talks to:
+
+- an OpenAI-compatible chat completions server that replies with scripted
+  tool calls (streaming and non-streaming)
+- an OpenWeatherMap-compatible current weather server
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+USERNAME = re.compile(r"username: '([^']+)'")
+COORDS = re.compile(r"lat (-?[\d.]+), lon (-?[\d.]+)")
+
+SAMPLE_OUTFITS = [
+    [{"type": "hoodie", "color": "red"}, {"type": "jeans", "color": "black"}],
+    [{"type": "t-shirt", "color": "white"}, {"type": "shorts", "color": "khaki"}],
+    [{"type": "jacket", "color": "navy", "style": "denim"}, {"type": "chinos", "color": "beige"}],
+    [{"type": "sweater", "color": "green", "style": "wool"}, {"type": "trousers", "color": "grey"}],
+    [{"type": "coat", "color": "camel"}, {"type": "boots", "color": "brown"}],
+]
+
+
+class _Server:
+    def __init__(self, handler):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+def _script(messages):
+    """
+    Decide the next assistant move from the conversation:
+    a tool call for recognised intents, otherwise (or after a tool ran) text.
+    """
+    if messages and messages[-1].get("role") == "tool":
+        return None, "Here you go — based on your wardrobe, this should work nicely 😎"
+
+    system = " ".join(
+        m.get("content") or "" for m in messages if m.get("role") == "system"
+    )
+    user_text = ""
+    for m in reversed(messages):
+        if m.get("role") == "user":
+            content = m.get("content")
+            user_text = content if isinstance(content, str) else json.dumps(content)
+            break
+    text = user_text.lower()
+    match = USERNAME.search(system)
+    username = match.group(1) if match else "bench_user"
+
+    if "add" in text or "bought" in text:
+        return ("store_user_outfit", {
+            "username": username, "outfit": random.choice(SAMPLE_OUTFITS),
+        }), None
+    if "wore" in text:
+        return ("store_worn_outfits", {
+            "username": username, "outfits": [random.choice(SAMPLE_OUTFITS)],
+        }), None
+    if "wear" in text or "recommend" in text:
+        args = {"username": username}
+        coords = COORDS.search(system)
+        if coords:
+            args.update(latitude=float(coords.group(1)), longitude=float(coords.group(2)))
+        return ("recommend_outfits", args), None
+    if "liked" in text:
+        return ("filter_outfits_by_feedback", {"username": username, "feedback": "like"}), None
+    return None, "Happy to help with your outfits! 👕"
+
+
+class FakeOpenAIServer(_Server):
+    """OpenAI-compatible /v1/chat/completions with scripted replies."""
+
+    def __init__(self, latency: float = 0.0, tokens_per_second: float = 0.0):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                time.sleep(server.latency)
+                call, text = _script(body.get("messages", []))
+                if body.get("stream"):
+                    self._stream(body, call, text)
+                else:
+                    self._complete(body, call, text)
+
+            def _complete(self, body, call, text):
+                message = {"role": "assistant", "content": text}
+                if call:
+                    message["tool_calls"] = [{
+                        "id": f"call_{uuid.uuid4().hex[:12]}",
+                        "type": "function",
+                        "function": {"name": call[0], "arguments": json.dumps(call[1])},
+                    }]
+                payload = {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [{
+                        "index": 0,
+                        "message": message,
+                        "finish_reason": "tool_calls" if call else "stop",
+                    }],
+                    "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+                }
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body, call, text):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                base = {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                }
+
+                def send(delta, finish=None, usage=None):
+                    chunk = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": finish}])
+                    if usage is not None:
+                        chunk = dict(base, choices=[], usage=usage)
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+
+                send({"role": "assistant"})
+                if call:
+                    send({"tool_calls": [{
+                        "index": 0,
+                        "id": f"call_{uuid.uuid4().hex[:12]}",
+                        "type": "function",
+                        "function": {"name": call[0], "arguments": json.dumps(call[1])},
+                    }]})
+                    send({}, "tool_calls")
+                else:
+                    for word in text.split(" "):
+                        if server.tokens_per_second:
+                            time.sleep(1 / server.tokens_per_second)
+                        send({"content": word + " "})
+                    send({}, "stop")
+                send({}, usage={"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        super().__init__(Handler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+
+    @property
+    def base_url(self) -> str:
+        return self.url + "/v1"
+
+
+class FakeWeatherServer(_Server):
+    """OpenWeatherMap-compatible current weather endpoint."""
+
+    def __init__(self, latency: float = 0.0):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                time.sleep(server.latency)
+                server.requests += 1
+                data = json.dumps({
+                    "weather": [{"description": "scattered clouds"}],
+                    "main": {"temp": 18.5, "feels_like": 17.9},
+                }).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        super().__init__(Handler)
+        self.latency = latency
+        self.requests = 0
@@ -0,0 +1,59 @@
+"""
+Chat messages stored one document per message in ``chat_messages``, keyed by
+``(session_id, seq)``. The session document only keeps a ``message_count``
+counter used to allocate sequence numbers; messages are written through
+``write_behind.append_messages``.
+"""
+from typing import List, Optional, Tuple
+
+from bson import ObjectId
+
+from db import messages_collection
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MESSAGE_PROJECTION = {"_id": 0, "seq": 1, "role": 1, "content": 1, "timestamp": 1}
+
+
+def clamp_limit(limit, default: int = DEFAULT_PAGE_SIZE) -> int:
+    try:
+        return min(MAX_PAGE_SIZE, max(1, int(limit)))
+    except (TypeError, ValueError):
+        return default
+
+
+def fetch_messages(session_id: str,
+                   before: Optional[int] = None,
+                   limit: int = DEFAULT_PAGE_SIZE) -> Tuple[List[dict], Optional[int]]:
+    """
+    Fetch the newest ``limit`` messages with ``seq < before``.
+
+    Returns:
+        (messages oldest-first, cursor for the next older page or None)
+    """
+    query = {"session_id": ObjectId(session_id)}
+    if before is not None:
+        query["seq"] = {"$lt": before}
+    page = list(
+        messages_collection.find(query, MESSAGE_PROJECTION)
+        .sort("seq", -1)
+        .limit(limit + 1)
+    )
+    has_more = len(page) > limit
+    page = page[:limit][::-1]
+    cursor = page[0]["seq"] if has_more and page else None
+    return page, cursor
+
+
+def fetch_range(session_id: str, start: int, end: int) -> List[dict]:
+    """Messages with ``start <= seq < end``, oldest first."""
+    return list(
+        messages_collection.find(
+            {"session_id": ObjectId(session_id), "seq": {"$gte": start, "$lt": end}},
+            MESSAGE_PROJECTION,
+        ).sort("seq", 1)
+    )
+
+
+def delete_messages(session_id: str) -> None:
+    messages_collection.delete_many({"session_id": ObjectId(session_id)})
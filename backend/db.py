@@ -1,10 +1,51 @@
-from pymongo import MongoClient
+import os
 
-MONGO_URI = "mongodb://localhost:27017"
-client = MongoClient(MONGO_URI)
-db = client["outfit_db"]
+from pymongo import MongoClient, ASCENDING, DESCENDING
+
+from telemetry import mongo_listener
+from dotenv import load_dotenv
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+MONGO_DB = os.getenv("MONGO_DB", "outfit_db")
+# connect=False: no network work until the first operation
+client = MongoClient(MONGO_URI, connect=False, event_listeners=[mongo_listener])
+db = client[MONGO_DB]
 outfit_collection = db["user_outfits"]
 users_collection = db["users"]
 sessions_collection = db["chat_sessions"]
+messages_collection = db["chat_messages"]
 recent_outfits_collection = db["recent_outfits"]
 feedback_collection = db['user_feedbacks']
+wardrobe_items_collection = db["wardrobe_items"]
+preferences_collection = db["user_preferences"]
+agent_states_collection = db["agent_states"]
+data_versions_collection = db["data_versions"]
+precomputed_collection = db["precomputed_recommendations"]
+wear_history_collection = db["wear_history"]
+
+
+def ensure_indexes():
+    """Create the indexes the per-user, newest-first queries rely on."""
+    users_collection.create_index("username", unique=True)
+    users_collection.create_index("email", unique=True)
+    users_collection.create_index("last_seen", sparse=True)
+    for collection in (outfit_collection, recent_outfits_collection, feedback_collection):
+        collection.create_index([("username", ASCENDING), ("timestamp", DESCENDING)])
+    feedback_collection.create_index(
+        [("username", ASCENDING), ("feedback", ASCENDING), ("timestamp", DESCENDING)]
+    )
+    sessions_collection.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
+    messages_collection.create_index(
+        [("session_id", ASCENDING), ("seq", ASCENDING)], unique=True
+    )
+    messages_collection.create_index("turn_id", sparse=True)
+    for field in ("type", "category", "color_family", "warmth"):
+        wardrobe_items_collection.create_index(
+            [("username", ASCENDING), (field, ASCENDING), ("timestamp", DESCENDING)]
+        )
+    wardrobe_items_collection.create_index([("outfit_id", ASCENDING)])
+    preferences_collection.create_index("username", unique=True)
+    wear_history_collection.create_index("username", unique=True)
+    # Precomputed picks are dropped by MongoDB once they expire
+    precomputed_collection.create_index("expires_at", expireAfterSeconds=0)
@@ -0,0 +1,126 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Coroutine, Iterator, Optional
+
+
+def _in_caller_context(coro: Coroutine) -> Coroutine:
+    """
+    Carry the caller's context variables (e.g. the request trace) into the
+    task; run_coroutine_threadsafe would otherwise start from the loop's own.
+    """
+    context = contextvars.copy_context()
+
+    async def run():
+        for var, value in context.items():
+            var.set(value)
+        return await coro
+
+    return run()
+
+
+class BackgroundLoop:
+    """
+    A single asyncio event loop running on a daemon thread.
+
+    Sync Flask views submit coroutines to it instead of calling
+    ``asyncio.run`` per request, so the model client and its connection
+    pool live on one long-lived loop and many slow model calls can be in
+    flight at once.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    thread = threading.Thread(
+                        target=loop.run_forever, name="async-loop", daemon=True
+                    )
+                    thread.start()
+                    self._thread = thread
+                    self._loop = loop
+        return self._loop
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Run ``coro`` on the background loop and block until it finishes."""
+        future = asyncio.run_coroutine_threadsafe(_in_caller_context(coro), self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def submit(self, coro: Coroutine):
+        """Schedule ``coro`` without waiting; returns a concurrent future."""
+        return asyncio.run_coroutine_threadsafe(_in_caller_context(coro), self.loop)
+
+    def iterate(self, agen: AsyncIterator, timeout: Optional[float] = None) -> Iterator:
+        """
+        Consume an async iterator on the background loop and yield its items
+        synchronously, e.g. from a Flask streaming response generator.
+
+        With ``timeout``, the iterator is cancelled and TimeoutError raised
+        once it has run that many seconds in total.
+        """
+        items: queue.Queue = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put((item, None))
+            except BaseException as e:
+                items.put((done, e))
+                raise
+            items.put((done, None))
+
+        future = self.submit(pump())
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            while True:
+                try:
+                    item, error = items.get(
+                        timeout=None if deadline is None else max(0.0, deadline - time.monotonic())
+                    )
+                except queue.Empty:
+                    raise concurrent.futures.TimeoutError() from None
+                if item is done:
+                    if error is not None and not isinstance(
+                        error, asyncio.CancelledError
+                    ):
+                        raise error
+                    return
+                yield item
+        finally:
+            # Client went away or the consumer stopped early.
+            if not future.done():
+                future.cancel()
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
+        self._thread = None
+
+
+background_loop = BackgroundLoop()
+
+
+def run_async(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    return background_loop.run(coro, timeout)
+
+
+def iterate_async(agen: AsyncIterator, timeout: Optional[float] = None) -> Iterator:
+    return background_loop.iterate(agen, timeout)
@@ -0,0 +1,75 @@
+import re
+from typing import Optional
+
+from function_tools import (
+    retrieve_user_outfit,
+    retrieve_recent_outfits,
+    filter_outfits_by_feedback,
+)
+from response_cache import response_cache, WARDROBE, RECENT, FEEDBACK
+from write_behind import write_behind
+
+# Matched against the whole (normalized) message, so anything beyond a plain
+# request falls through to the agent.
+SHOW_WARDROBE = re.compile(
+    r"^(please )?(show|list|view|see|display)( me)?( all)? my "
+    r"(saved )?(outfits|wardrobe|clothes|closet)( please)?$"
+)
+RECENT_OUTFITS = re.compile(
+    r"^what (did|have) i (wear|worn)"
+    r"( (recently|lately|last week|this week|yesterday|in the (last|past) (\d+) days))?$"
+)
+FEEDBACK_OUTFITS = re.compile(
+    r"^(what are|show( me)?|list) (all )?(my|the) (outfits i )?(liked|disliked)( outfits)?$"
+    r"|^what outfits did i (like|dislike)$"
+)
+
+DAYS = {"recently": 10, "lately": 10, "last week": 7, "this week": 7, "yesterday": 1}
+
+
+def normalize(message: str) -> str:
+    """Lowercase, punctuation to spaces, single spaces: what the patterns match against."""
+    text = re.sub(r"[^\w\s']", " ", message.lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def answer(username: str, message: str) -> Optional[str]:
+    """
+    Serve plain read requests (wardrobe, recent outfits, liked/disliked
+    outfits) straight from the tool formatters, without a model call.
+
+    Returns:
+        The rendered reply, or None when the message needs the agent
+    """
+    text = normalize(message)
+
+    if SHOW_WARDROBE.match(text):
+        return _render(username, WARDROBE, "page1", lambda: retrieve_user_outfit(username))
+
+    match = RECENT_OUTFITS.match(text)
+    if match:
+        days = int(match.group(6)) if match.group(6) else DAYS.get(match.group(4), 10)
+        return _render(
+            username, RECENT, days, lambda: retrieve_recent_outfits(username, days)
+        )
+
+    match = FEEDBACK_OUTFITS.match(text)
+    if match:
+        feedback = "dislike" if "dislike" in text else "like"
+        return _render(
+            username, FEEDBACK, feedback,
+            lambda: filter_outfits_by_feedback(username, feedback),
+        )
+
+    return None
+
+
+def _render(username, kind, args, render):
+    def fresh():
+        # Make sure the user's own queued writes are visible before reading
+        write_behind.flush_user(username)
+        return render()
+
+    return response_cache.get_or_render(
+        username, kind, args, fresh, cacheable=lambda text: not text.startswith("⚠️")
+    )
@@ -1,13 +1,134 @@
-from autogen_core.tools import FunctionTool
+import functools
+import json
+import os
+import re
+from contextvars import ContextVar
 from datetime import datetime, timezone, timedelta
 from pymongo.errors import PyMongoError
-from db import outfit_collection, recent_outfits_collection, feedback_collection
-import os
+from db import (
+    outfit_collection,
+    recent_outfits_collection,
+    feedback_collection,
+    wardrobe_items_collection,
+)
+from weather import weather_service
+from write_behind import write_behind
+from response_cache import invalidate, WARDROBE, RECENT, FEEDBACK
+from wardrobe_index import index_outfit, normalize_item
+from recommender import recommend, format_recommendations
+from preferences import record_feedback
+from wear_history import record_wear, load_wear_history, wear_counts, worn_pieces, WINDOWS
+import logging
 import requests
 
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+OUTFIT_PROJECTION = {"_id": 0, "outfit": 1, "timestamp": 1}
+FEEDBACK_PROJECTION = {"_id": 0, "suggested_outfit": 1, "timestamp": 1}
+ITEM_PROJECTION = {"_id": 0, "type": 1, "color": 1, "style": 1, "category": 1, "warmth": 1}
+
+# Listings are rendered as prose for people, or as compact JSON (garments
+# deduplicated into an id table) when the result only goes to the model.
+PROSE = "prose"
+COMPACT = "compact"
+MODEL_OUTPUT_FORMAT = os.getenv("TOOL_OUTPUT_FORMAT", COMPACT)
+output_format: ContextVar[str] = ContextVar("output_format", default=PROSE)
+
+
+def for_model(func):
+    """Wrap a tool function so it renders in MODEL_OUTPUT_FORMAT (same signature)."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        token = output_format.set(MODEL_OUTPUT_FORMAT)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            output_format.reset(token)
+
+    return wrapper
+
+
+def _read_own_writes(username):
+    # e.g. a store earlier in the same turn
+    write_behind.flush_user(username)
+
+
+def _clamp_page(page, page_size):
+    """Coerce page/page_size from model-supplied values into a safe range."""
+    try:
+        page = max(1, int(page))
+    except (TypeError, ValueError):
+        page = 1
+    try:
+        page_size = min(MAX_PAGE_SIZE, max(1, int(page_size)))
+    except (TypeError, ValueError):
+        page_size = DEFAULT_PAGE_SIZE
+    return page, page_size
+
+
+def _as_utc(time):
+    if not isinstance(time, datetime):
+        return None
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return time
+
+
+def _format_pieces(pieces):
+    lines = []
+    for piece in pieces:
+        desc = f" - {piece.get('color', 'unknown')} {piece.get('type', 'item')}"
+        if "style" in piece:
+            desc += f" ({piece['style']})"
+        lines.append(desc)
+    return lines
+
+
+def _describe(piece):
+    desc = f"{piece.get('color', 'unknown')} {piece.get('type', 'item')}"
+    if piece.get("style"):
+        desc += f" ({piece['style']})"
+    return desc
+
+
+def _garment_table(outfits):
+    """
+    Deduplicate the garments of several outfits into an id table.
+
+    Returns:
+        ({garment id: description}, [[garment id, ...] per outfit])
+    """
+    ids = {}
+    refs = []
+    for pieces in outfits:
+        refs.append([
+            ids.setdefault(_describe(piece), f"g{len(ids) + 1}")
+            for piece in pieces
+            if isinstance(piece, dict)
+        ])
+    return {gid: desc for desc, gid in ids.items()}, refs
+
+
+def _compact_outfits(records, field, first=1, **extra):
+    garments, refs = _garment_table(record.get(field, []) for record in records)
+    outfits = []
+    for idx, (record, garment_ids) in enumerate(zip(records, refs), start=first):
+        entry = {"n": idx, "garments": garment_ids}
+        time = _as_utc(record.get("timestamp"))
+        if time:
+            entry["date"] = time.strftime("%Y-%m-%d")
+        outfits.append(entry)
+    return _compact({**extra, "garments": garments, "outfits": outfits})
+
+
+def _compact(payload):
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
 
 def store_user_outfit(username: str, outfit: list) -> str:
     """
@@ -29,7 +150,9 @@ def store_user_outfit(username: str, outfit: list) -> str:
             "outfit": outfit,
             "timestamp": datetime.now(timezone.utc),
         }
-        outfit_collection.insert_one(data)
+        write_behind.insert(outfit_collection.name, data)
+        index_outfit(username, data)
+        invalidate(username, WARDROBE)
         return "✅ Outfit saved successfully! You’ve got style 😎"
 
     except PyMongoError as e:
@@ -39,43 +162,53 @@ def store_user_outfit(username: str, outfit: list) -> str:
         )
 
 
-def retrieve_user_outfit(username: str) -> str:
+def retrieve_user_outfit(username: str, page: int = 1, page_size: int = DEFAULT_PAGE_SIZE) -> str:
     """
-    retrieves user's outfit
+    retrieves user's outfit, newest first, one page at a time
     Parameters:
         username (str): user's unique Identifier
+        page (int): 1-based page number
+        page_size (int): outfits per page (capped at MAX_PAGE_SIZE)
     Returns:
-        dict: dictionary of user outfits
+        str: formatted list of the user's outfits on that page
     """
 
     try:
+        _read_own_writes(username)
+        page, page_size = _clamp_page(page, page_size)
         outfits = list(
-            outfit_collection.find({"username": username}).sort("timestamp", -1)
+            outfit_collection.find({"username": username}, OUTFIT_PROJECTION)
+            .sort("timestamp", -1)
+            .skip((page - 1) * page_size)
+            .limit(page_size + 1)
         )
+        has_more = len(outfits) > page_size
+        outfits = outfits[:page_size]
 
         if not outfits:
+            if page > 1:
+                return f"👕 No more saved outfits after page {page - 1}."
             return "👕 You haven't saved any outfits yet. Try adding one and I'll keep track for you!"
 
+        first = (page - 1) * page_size + 1
+        if output_format.get() == COMPACT:
+            extra = {"next_page": page + 1} if has_more else {}
+            return _compact_outfits(outfits, "outfit", first, **extra)
+
         # Format the outfit list
-        response = f"Here are your saved outfits, {username}:\n\n"
-        for idx, item in enumerate(outfits, start=1):
-            response += f"🧥 Outfit {idx}:\n"
-            for piece in item["outfit"]:
-                desc = f" - {piece.get('color', 'unknown')} {piece.get('type', 'item')}"
-                if "style" in piece:
-                    desc += f" ({piece['style']})"
-                response += desc + "\n"
-            time = item.get("timestamp")
+        lines = [f"Here are your saved outfits, {username}:", ""]
+        for idx, item in enumerate(outfits, start=first):
+            lines.append(f"🧥 Outfit {idx}:")
+            lines.extend(_format_pieces(item.get("outfit", [])))
+            time = _as_utc(item.get("timestamp"))
             if time:
-                if time.tzinfo is None:
-                    time = time.replace(tzinfo=timezone.utc)
-
-            if isinstance(time, datetime):
-                response += f"   ⏱️ Saved on {time.strftime('%Y-%m-%d %H:%M')}\n"
+                lines.append(f"   ⏱️ Saved on {time.strftime('%Y-%m-%d %H:%M')}")
+            lines.append("")
 
-            response += "\n"
+        if has_more:
+            lines.append(f"(More outfits available — ask for page {page + 1}.)")
 
-        return response.strip()
+        return "\n".join(lines).strip()
 
     except Exception as e:
         return "⚠️ Hmm, I couldn't fetch your outfits right now — the database might be down. Please try again soon!"
@@ -88,6 +221,7 @@ def store_worn_outfits(username: str, outfits: list, date: datetime = None) -> s
     - username: unique identifier of the user
     - outfits: list of outfits (each outfit is a list of clothing items)
                e.g., [[{"type": "shirt", "color": "blue"}], [{"type": "pants", "color": "black"}]]
+               A flat list of items is stored as one outfit.
     - date: datetime object representing the date the outfits were worn (defaults to now)
 
     Returns:
@@ -102,18 +236,27 @@ def store_worn_outfits(username: str, outfits: list, date: datetime = None) -> s
         if timestamp.tzinfo is None:
             timestamp = timestamp.replace(tzinfo=timezone.utc)
 
+        if all(isinstance(piece, dict) for piece in outfits):
+            outfits = [outfits]
+
+        # One document per outfit
         documents = [
             {
                 "username": username,
-                "outfit": outfits,
+                "outfit": [piece for piece in outfit if isinstance(piece, dict)],
                 "timestamp": timestamp,
             }
+            for outfit in outfits
+            if isinstance(outfit, list) and any(isinstance(piece, dict) for piece in outfit)
         ]
 
         if not documents:
             return "⚠️ All provided outfits were invalid. Nothing was saved."
 
-        recent_outfits_collection.insert_one(documents)
+        for document in documents:
+            write_behind.insert(recent_outfits_collection.name, document)
+        record_wear(username, [document["outfit"] for document in documents], timestamp)
+        invalidate(username, RECENT)
 
         return f"✅ {len(documents)} worn outfit(s) saved for {username} on {timestamp.strftime('%Y-%m-%d')}."
 
@@ -121,79 +264,115 @@ def store_worn_outfits(username: str, outfits: list, date: datetime = None) -> s
         return "⚠️ Couldn't save your worn outfits due to a database error. Please try again later."
 
 
-def retrieve_recent_outfits(username: str, days: int = 10) -> str:
+def retrieve_recent_outfits(username: str, days: int = 10, limit: int = DEFAULT_PAGE_SIZE) -> str:
     """
     Retrieve a user's outfits stored in the recent_outfits_collection within the past `days`.
 
     Parameters:
     - username: unique identifier of the user
     - days: number of past days to look back (default is 10)
+    - limit: maximum number of outfits to return (capped at MAX_PAGE_SIZE)
 
     Returns:
     - A string description of recent outfits
     """
     try:
+        _read_own_writes(username)
+        _, limit = _clamp_page(1, limit)
         threshold_date = datetime.now(timezone.utc) - timedelta(days=days)
         recent_outfits = list(
             recent_outfits_collection.find({
                 "username": username,
                 "timestamp": {"$gte": threshold_date}
-            }).sort("timestamp", -1)
+            }, OUTFIT_PROJECTION).sort("timestamp", -1).limit(limit)
         )
+        # Older records hold several outfits nested in one document
+        for item in recent_outfits:
+            item["outfit"] = worn_pieces(item.get("outfit"))
 
         if not recent_outfits:
             return f"🧾 No outfits found in the last {days} days for user '{username}'."
 
-        response = f"🕒 Outfits you've saved in the last {days} days, {username}:\n\n"
+        if output_format.get() == COMPACT:
+            return _compact_outfits(recent_outfits, "outfit", days=days)
+
+        lines = [f"🕒 Outfits you've saved in the last {days} days, {username}:", ""]
         for idx, item in enumerate(recent_outfits, start=1):
-            response += f"🧥 Recent Outfit {idx}:\n"
-            for piece in item["outfit"]:
-                desc = f" - {piece.get('color', 'unknown')} {piece.get('type', 'item')}"
-                if "style" in piece:
-                    desc += f" ({piece['style']})"
-                response += desc + "\n"
-            time = item.get("timestamp")
-            if isinstance(time, datetime):
-                if time.tzinfo is None:
-                    time = time.replace(tzinfo=timezone.utc)
-                response += f"   ⏱️ Saved on {time.strftime('%Y-%m-%d %H:%M')}\n"
-
-            response += "\n"
-
-        return response.strip()
+            lines.append(f"🧥 Recent Outfit {idx}:")
+            lines.extend(_format_pieces(item.get("outfit", [])))
+            time = _as_utc(item.get("timestamp"))
+            if time:
+                lines.append(f"   ⏱️ Saved on {time.strftime('%Y-%m-%d %H:%M')}")
+            lines.append("")
+
+        return "\n".join(lines).strip()
 
     except Exception as e:
         return "⚠️ Sorry, couldn't retrieve your recent outfits. Please check again soon!"
 
+def recently_worn_garments(username: str, days: int = 10) -> str:
+    """
+    Garments the user wore in the past `days`, from the wear history rollup.
+
+    Parameters:
+    - username: unique identifier of the user
+    - days: number of past days to look back (default is 10)
+
+    Returns:
+    - Each garment with when it was last worn and how often lately
+    """
+    try:
+        _read_own_writes(username)
+        now = datetime.now(timezone.utc)
+        worn = sorted(
+            (
+                (entry["last_worn"], garment, wear_counts(entry, now))
+                for garment, entry in load_wear_history(username).items()
+                if entry["last_worn"] >= now - timedelta(days=days)
+            ),
+            reverse=True,
+        )
+        if not worn:
+            return f"🧾 Nothing worn in the last {days} days for user '{username}'."
+
+        if output_format.get() == COMPACT:
+            return _compact({
+                "columns": ["garment", "last_worn", *[f"worn_{d}d" for d in WINDOWS]],
+                "garments": [
+                    [_describe({"type": type_, "color": color}),
+                     last_worn.strftime("%Y-%m-%d"), *counts.values()]
+                    for last_worn, (type_, color), counts in worn
+                ],
+            })
+
+        lines = [f"🕒 Garments you've worn in the last {days} days, {username}:"]
+        for last_worn, (type_, color), counts in worn:
+            recent = ", ".join(f"{n}× in {d} days" for d, n in counts.items())
+            lines.append(
+                f" - {color} {type_}: last worn {last_worn.strftime('%Y-%m-%d')} ({recent})"
+            )
+        return "\n".join(lines)
+
+    except PyMongoError as e:
+        return "⚠️ Sorry, couldn't retrieve your recently worn garments. Please check again soon!"
+
 def get_weather_by_coords(latitude: float, longitude: float) -> str:
     """
     Fetches current weather data from OpenWeatherMap using coordinates.
+    Readings are cached per geo cell, so nearby users share one fetch.
     
     Returns a formatted string like:
     "Weather: Clear sky, 28.5 °C (feels like 29.2 °C)."
     """
-    OPENWEATHERMAP_API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
-    if not OPENWEATHERMAP_API_KEY:
-        raise ValueError("⚠️ OpenWeatherMap API key is not set in the environment.")
-
-    url = (
-        f"https://api.openweathermap.org/data/2.5/weather?"
-        f"lat={latitude}&lon={longitude}&units=metric&appid={OPENWEATHERMAP_API_KEY}"
-    )
-
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-
-        description = data["weather"][0]["description"].capitalize()
-        temperature = data["main"]["temp"]
-        feels_like = data["main"]["feels_like"]
-
-        return f"Weather: {description}, {temperature:.1f} °C (feels like {feels_like:.1f} °C)."
+        weather = weather_service.get(latitude, longitude)
+        return (
+            f"Weather: {weather['description']}, {weather['temperature']:.1f} °C "
+            f"(feels like {weather['feels_like']:.1f} °C)."
+        )
 
     except requests.RequestException as e:
-        print("❌ Failed to fetch weather data:", e)
+        logger.warning("Failed to fetch weather data: %s", e)
         return "❌ Unable to fetch weather data due to a request error."
 
 def save_outfit_feedback(username: str, suggested_outfit: list, feedback: str) -> str:
@@ -211,19 +390,22 @@ def save_outfit_feedback(username: str, suggested_outfit: list, feedback: str) -
             "timestamp": datetime.now(timezone.utc)
         }
 
-        feedback_collection.insert_one(doc)
+        write_behind.insert(feedback_collection.name, doc)
+        record_feedback(username, suggested_outfit, feedback, doc["timestamp"])
+        invalidate(username, FEEDBACK)
         return "✅ Feedback saved. We'll improve your future recommendations!"
 
     except PyMongoError as e:
         return "⚠️ Error saving feedback: " + str(e)
 
-def filter_outfits_by_feedback(username: str, feedback: str) -> str:
+def filter_outfits_by_feedback(username: str, feedback: str, limit: int = DEFAULT_PAGE_SIZE) -> str:
     """
     Retrieve outfits suggested to the user filtered by feedback type ("like" or "dislike" or "normal").
 
     Parameters:
     - username: unique identifier of the user
     - feedback: "like" , "dislike" or "normal"
+    - limit: maximum number of outfits to return (capped at MAX_PAGE_SIZE)
 
     Returns:
     - A formatted string listing outfits with the specified feedback
@@ -232,78 +414,163 @@ def filter_outfits_by_feedback(username: str, feedback: str) -> str:
         return "⚠️ Feedback must be 'like' or 'dislike'."
 
     try:
+        _read_own_writes(username)
+        _, limit = _clamp_page(1, limit)
         records = list(
             feedback_collection.find({
                 "username": username,
                 "feedback": feedback
-            }).sort("timestamp", -1)
+            }, FEEDBACK_PROJECTION).sort("timestamp", -1).limit(limit)
         )
 
         if not records:
             return f"🧾 No outfits found with feedback '{feedback}' for user '{username}'."
 
-        response = f"👗 Outfits you marked as '{feedback}', {username}:\n\n"
+        if output_format.get() == COMPACT:
+            return _compact_outfits(records, "suggested_outfit", feedback=feedback)
+
+        lines = [f"👗 Outfits you marked as '{feedback}', {username}:", ""]
 
         for idx, record in enumerate(records, start=1):
-            outfit = record.get("suggested_outfit", [])
-            response += f"🧥 Outfit {idx}:\n"
-            for piece in outfit:
-                desc = f" - {piece.get('color', 'unknown')} {piece.get('type', 'item')}"
-                if "style" in piece:
-                    desc += f" ({piece['style']})"
-                response += desc + "\n"
-            time = record.get("timestamp")
-            if isinstance(time, datetime):
-                if time.tzinfo is None:
-                    time = time.replace(tzinfo=timezone.utc)
-                response += f"   ⏱️ Feedback given on {time.strftime('%Y-%m-%d %H:%M')}\n"
-            response += "\n"
-
-        return response.strip()
+            lines.append(f"🧥 Outfit {idx}:")
+            lines.extend(_format_pieces(record.get("suggested_outfit", [])))
+            time = _as_utc(record.get("timestamp"))
+            if time:
+                lines.append(f"   ⏱️ Feedback given on {time.strftime('%Y-%m-%d %H:%M')}")
+            lines.append("")
+
+        return "\n".join(lines).strip()
 
     except Exception as e:
         return "⚠️ Unable to retrieve outfits by feedback right now. Please try again later."
 
 
-retrieve_outfit_tool = FunctionTool(
-    name="retrieve_user_outfit",
-    func=retrieve_user_outfit,
-    description="Retrieve already stored outfits of the given user",
-)
+def search_wardrobe_items(username: str,
+                           type: str = None,
+                           color: str = None,
+                           style: str = None,
+                           category: str = None,
+                           min_warmth: int = None,
+                           max_warmth: int = None,
+                           limit: int = 10) -> str:
+    """
+    Search the user's wardrobe for individual garments.
 
+    Parameters:
+    - username: unique identifier of the user
+    - type: garment type, e.g. "hoodie", "jeans"
+    - color: color or color family, e.g. "navy" or "blue"
+    - style: style keyword, e.g. "denim", "fur"
+    - category: one of top, bottom, outerwear, dress, footwear, accessory
+    - min_warmth / max_warmth: warmth from 1 (very light) to 5 (very warm)
+    - limit: maximum number of items to return (capped at MAX_PAGE_SIZE)
 
-store_outfit_tool = FunctionTool(
-    name="store_user_outfit",
-    func=store_user_outfit,
-    description="Store the uploaded outfit in MongoDB for a given user.",
-)
+    Returns:
+    - A short list of matching garments
+    """
+    query = {"username": username}
+    if type:
+        query["type"] = normalize_item({"type": type})["type"]
+    if color:
+        family = normalize_item({"color": color})["color_family"]
+        if color.strip().lower() == family:
+            query["color_family"] = family
+        else:
+            query["color"] = color.strip().lower()
+    if style:
+        query["style"] = {"$regex": re.escape(style.strip().lower())}
+    if category:
+        query["category"] = category.strip().lower()
+    warmth = {}
+    if min_warmth is not None:
+        warmth["$gte"] = int(min_warmth)
+    if max_warmth is not None:
+        warmth["$lte"] = int(max_warmth)
+    if warmth:
+        query["warmth"] = warmth
 
-store_worn_outfit_tool = FunctionTool(
-    name="store_worn_outfits",
-    func=store_worn_outfits,
-    description="Stores the user's worn outfit"
-)
+    try:
+        _read_own_writes(username)
+        _, limit = _clamp_page(1, limit)
+        items = list(
+            wardrobe_items_collection.find(query, ITEM_PROJECTION)
+            .sort("timestamp", -1)
+            .limit(limit)
+        )
 
-retrieve_recent_outfit_tool = FunctionTool(
-    name="retrieve_recent_outfit",
-    func=retrieve_recent_outfits,
-    description="Retrieves the recent outfits worn by the user"
-)
+        if not items:
+            return "🔍 No matching items found in your wardrobe."
+
+        if output_format.get() == COMPACT:
+            rows = []
+            for item in items:
+                row = [_describe(item), item.get("category"), item.get("warmth")]
+                if row not in rows:
+                    rows.append(row)
+            return _compact({"columns": ["garment", "category", "warmth"], "items": rows})
+
+        lines = [f"🔍 Matching items in your wardrobe, {username}:"]
+        for item in items:
+            desc = f" - {item.get('color', 'unknown')} {item.get('type', 'item')}"
+            if item.get("style"):
+                desc += f" ({item['style']})"
+            desc += f" [{item.get('category')}, warmth {item.get('warmth')}/5]"
+            lines.append(desc)
+        return "\n".join(lines)
 
-get_weather_tool = FunctionTool(
-    name="get_weather_tool",
-    func=get_weather_by_coords,
-    description="returns the weather in degree celsius given the coordinates"
-)
+    except PyMongoError as e:
+        return "⚠️ Couldn't search your wardrobe right now. Please try again later."
 
-save_outfit_feedback_tool = FunctionTool(
-    name="save_outfit_feedback",
-    func=save_outfit_feedback,
-    description="After suggesting outfit this tool saves the feedback from the user"
-)
 
-filter_outfits_by_feedback_tool = FunctionTool(
-    name="filter_outfits_by_feedback",
-    func=filter_outfits_by_feedback,
-    description="Retrieve outfits suggested to the user filtered by feedback type"
-)
+def recommend_outfits(username: str,
+                      latitude: float = None,
+                      longitude: float = None,
+                      top_k: int = 3) -> str:
+    """
+    Build and rank candidate outfits from the user's wardrobe locally.
+
+    Candidates are scored against the weather, recently worn garments and
+    past like/dislike feedback; only the best few are returned.
+
+    Parameters:
+    - username: unique identifier of the user
+    - latitude / longitude: current coordinates (optional)
+    - top_k: number of outfits to return (default 3)
+
+    Returns:
+    - A formatted list of the top outfit candidates
+    """
+    weather = None
+    if latitude is not None and longitude is not None:
+        try:
+            weather = weather_service.get(latitude, longitude)
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("Failed to fetch weather data: %s", e)
+
+    try:
+        _read_own_writes(username)
+        _, top_k = _clamp_page(1, top_k)
+        ranked = recommend(
+            username,
+            feels_like=weather["feels_like"] if weather else None,
+            top_k=top_k,
+        )
+        if ranked and output_format.get() == COMPACT:
+            garments, refs = _garment_table(pieces for _, pieces in ranked)
+            payload = {
+                "garments": garments,
+                "options": [
+                    {"n": idx, "score": round(score, 2), "garments": garment_ids}
+                    for idx, ((score, _), garment_ids) in enumerate(zip(ranked, refs), start=1)
+                ],
+            }
+            if weather:
+                payload["weather"] = {
+                    "description": weather["description"],
+                    "feels_like_c": round(weather["feels_like"], 1),
+                }
+            return _compact(payload)
+        return format_recommendations(username, ranked, weather)
+
+    except PyMongoError as e:
+        return "⚠️ Couldn't load your wardrobe to build recommendations. Please try again later."
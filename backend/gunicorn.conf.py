@@ -0,0 +1,57 @@
+"""
+Production server settings. Run from backend/:
+
+    gunicorn "app:create_app()"
+
+Chat turns mostly wait on the model, so each worker serves many requests on
+threads; more than one worker needs the shared state store (set below).
+"""
+import fcntl
+import multiprocessing
+import os
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+
+# Longer than a model turn (MODEL_TURN_TIMEOUT) so slow turns time out in
+# the app, not by the worker being killed; SSE streams also hold a thread.
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+
+# Each worker opens its own Mongo client, event loop and write-behind thread
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info").lower()
+
+if workers > 1:
+    # Agents and cache versions must be visible to every worker
+    raw_env = ["STATE_STORE=mongo"]
+
+
+def post_fork(server, worker):
+    """
+    Give each worker its own write-behind journal. Slots are claimed with a
+    file lock, so a replacement for a crashed worker picks up (and replays)
+    the journal it left behind.
+    """
+    base = os.getenv("WRITE_BEHIND_JOURNAL")
+    if not base:
+        return
+    for slot in range(workers * 2):
+        path = f"{base}.{slot}"
+        lock = open(f"{path}.lock", "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            continue
+        worker.journal_lock = lock  # held for the worker's lifetime
+        os.environ["WRITE_BEHIND_JOURNAL"] = path
+        server.log.info("Worker %s uses write-behind journal %s", worker.pid, path)
+        return
+    raise RuntimeError("No free write-behind journal slot")
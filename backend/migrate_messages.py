@@ -0,0 +1,96 @@
+"""
+Move messages embedded in ``chat_sessions.messages`` into ``chat_messages``.
+
+Safe to re-run, and to run while the app is serving: messages are upserted
+by ``(session_id, seq)``, the embedded array is only removed once its
+messages are written, and embedded messages keep seq 0..n-1. The app numbers
+new messages of such sessions after them; turns it appended before doing so
+are moved up out of the way.
+
+Usage: python migrate_messages.py [--batch-size N]
+"""
+import argparse
+
+from pymongo import ReturnDocument, UpdateOne
+
+from db import sessions_collection, messages_collection, ensure_indexes
+
+
+def make_room(session_id, count: int) -> None:
+    """
+    Move messages the app appended at seq < ``count`` up by ``count``.
+
+    The seq range is reserved first, so turns appended meanwhile land above
+    it; moving the highest seq first keeps ``(session_id, seq)`` unique.
+    """
+    before = sessions_collection.find_one_and_update(
+        {"_id": session_id},
+        {"$inc": {"message_count": count}},
+        projection={"message_count": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    appended = messages_collection.find(
+        {
+            "session_id": session_id,
+            "turn_id": {"$exists": True},
+            "seq": {"$lt": (before or {}).get("message_count", 0)},
+        },
+        {"_id": 1},
+    ).sort("seq", -1)
+    for message in appended:
+        messages_collection.update_one({"_id": message["_id"]}, {"$inc": {"seq": count}})
+
+
+def migrate_session(session: dict) -> int:
+    messages = session.get("messages") or []
+    # Turns appended before the app learned to number after embedded messages
+    if messages and messages_collection.find_one(
+        {"session_id": session["_id"], "turn_id": {"$exists": True}, "seq": {"$lt": len(messages)}},
+        {"_id": 1},
+    ):
+        make_room(session["_id"], len(messages))
+
+    ops = [
+        UpdateOne(
+            {"session_id": session["_id"], "seq": seq},
+            {"$setOnInsert": {
+                "session_id": session["_id"],
+                "seq": seq,
+                "role": message.get("role"),
+                "content": message.get("content"),
+                "timestamp": message.get("timestamp"),
+            }},
+            upsert=True,
+        )
+        for seq, message in enumerate(messages)
+    ]
+    if ops:
+        messages_collection.bulk_write(ops, ordered=False)
+
+    sessions_collection.update_one(
+        {"_id": session["_id"]},
+        {
+            "$max": {"message_count": len(messages)},
+            "$unset": {"messages": ""},
+        },
+    )
+    return len(messages)
+
+
+def migrate(batch_size: int = 100) -> None:
+    ensure_indexes()
+    sessions = sessions_collection.find(
+        {"messages": {"$exists": True}}, batch_size=batch_size
+    )
+    migrated_sessions = migrated_messages = 0
+    for session in sessions:
+        migrated_messages += migrate_session(session)
+        migrated_sessions += 1
+    print(f"✅ Migrated {migrated_messages} message(s) from {migrated_sessions} session(s).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    migrate(args.batch_size)
@@ -1,10 +1,270 @@
 from autogen_ext.models.openai import OpenAIChatCompletionClient
+from autogen_core.models import ChatCompletionClient
+from contextlib import contextmanager
+from contextvars import ContextVar
+import asyncio
+import heapq
+import itertools
 import os
+import random
+import threading
+import time
 
-model_client = OpenAIChatCompletionClient(
-    model="gpt-4-turbo",
-    api_key=os.getenv("OPENAI_API_KEY"),
-    temperature=0.4,
-    max_tokens=1024,
-    timeout=30,
+import openai
+
+from telemetry import register_stats, span
+
+INTERACTIVE = 0
+BACKGROUND = 10
+
+MAX_CONCURRENCY = int(os.getenv("MODEL_MAX_CONCURRENCY", "16"))
+MAX_REQUESTS_PER_SECOND = float(os.getenv("MODEL_MAX_RPS", "0"))  # 0 = unlimited
+MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = float(os.getenv("MODEL_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("MODEL_RETRY_MAX_DELAY", "8"))
+
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60)
+
+# Priority of model calls made from the current task; lower runs first.
+model_priority: ContextVar[int] = ContextVar("model_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def priority(level: int):
+    """Run model calls inside the block at the given priority."""
+    token = model_priority.set(level)
+    try:
+        yield
+    finally:
+        model_priority.reset(token)
+
+
+class PriorityLimiter:
+    """Async semaphore that wakes waiters in priority order (FIFO within a level)."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters = []
+        self._order = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for *_, fut in self._waiters if not fut.done())
+
+    async def acquire(self, level: int) -> None:
+        if self.active < self.limit and not self.waiting:
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (level, next(self._order), fut))
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Slot was handed over just as we were cancelled
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            *_, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                fut.set_result(None)  # hand the slot over
+                return
+        self.active -= 1
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def take(self) -> None:
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ModelMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latency_sum = 0.0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds: float, usage=None, error: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            self.errors += int(error)
+            self.latency_sum += seconds
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    self.latency_buckets[i] += 1
+                    break
+            else:
+                self.latency_buckets[-1] += 1
+            if usage is not None:
+                self.prompt_tokens += usage.prompt_tokens or 0
+                self.completion_tokens += usage.completion_tokens or 0
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "retries": self.retries,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "latency_sum": self.latency_sum,
+                "latency_buckets": dict(
+                    zip([*map(str, LATENCY_BUCKETS), "+Inf"], self.latency_buckets)
+                ),
+            }
+
+
+class ModelGateway(ChatCompletionClient):
+    """
+    Wraps a chat completion client with a priority-aware concurrency limit,
+    optional request-rate limit, jittered retries and per-call metrics.
+    Interactive turns run ahead of background work (see ``priority``).
+    """
+
+    def __init__(self,
+                 client: ChatCompletionClient,
+                 max_concurrency: int = MAX_CONCURRENCY,
+                 max_rps: float = MAX_REQUESTS_PER_SECOND,
+                 max_retries: int = MAX_RETRIES):
+        self._client = client
+        self._limiter = PriorityLimiter(max_concurrency)
+        self._bucket = TokenBucket(max_rps) if max_rps > 0 else None
+        self._max_retries = max_retries
+        self.metrics = ModelMetrics()
+
+    async def _acquire(self) -> None:
+        await self._limiter.acquire(model_priority.get())
+        if self._bucket:
+            try:
+                await self._bucket.take()
+            except BaseException:
+                self._limiter.release()
+                raise
+
+    async def _backoff(self, attempt: int) -> None:
+        self.metrics.retries += 1
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+        await asyncio.sleep(random.uniform(0, delay))  # full jitter
+
+    async def create(self, messages, **kwargs):
+        for attempt in range(self._max_retries + 1):
+            await self._acquire()
+            start = time.perf_counter()
+            try:
+                with span("model.create", attempt=attempt) as attrs:
+                    result = await self._client.create(messages, **kwargs)
+                    if result.usage is not None:
+                        attrs["prompt_tokens"] = result.usage.prompt_tokens
+            except RETRYABLE_ERRORS:
+                self.metrics.observe(time.perf_counter() - start, error=True)
+                if attempt == self._max_retries:
+                    raise
+            except Exception:
+                self.metrics.observe(time.perf_counter() - start, error=True)
+                raise
+            else:
+                self.metrics.observe(time.perf_counter() - start, result.usage)
+                return result
+            finally:
+                self._limiter.release()
+            await self._backoff(attempt)
+
+    async def create_stream(self, messages, **kwargs):
+        for attempt in range(self._max_retries + 1):
+            await self._acquire()
+            start = time.perf_counter()
+            started = False
+            try:
+                with span("model.stream", attempt=attempt) as attrs:
+                    async for chunk in self._client.create_stream(messages, **kwargs):
+                        started = True
+                        if not isinstance(chunk, str):
+                            self.metrics.observe(time.perf_counter() - start, chunk.usage)
+                            if chunk.usage is not None:
+                                attrs["prompt_tokens"] = chunk.usage.prompt_tokens
+                        yield chunk
+                return
+            except RETRYABLE_ERRORS:
+                self.metrics.observe(time.perf_counter() - start, error=True)
+                # Only safe to retry before anything reached the caller
+                if started or attempt == self._max_retries:
+                    raise
+            except Exception:
+                self.metrics.observe(time.perf_counter() - start, error=True)
+                raise
+            finally:
+                self._limiter.release()
+            await self._backoff(attempt)
+
+    async def close(self) -> None:
+        await self._client.close()
+
+    def actual_usage(self):
+        return self._client.actual_usage()
+
+    def total_usage(self):
+        return self._client.total_usage()
+
+    def count_tokens(self, messages, **kwargs) -> int:
+        return self._client.count_tokens(messages, **kwargs)
+
+    def remaining_tokens(self, messages, **kwargs) -> int:
+        return self._client.remaining_tokens(messages, **kwargs)
+
+    @property
+    def capabilities(self):
+        return self._client.capabilities
+
+    @property
+    def model_info(self):
+        return self._client.model_info
+
+    def stats(self) -> dict:
+        return {
+            **self.metrics.snapshot(),
+            "in_flight": self._limiter.active,
+            "waiting": self._limiter.waiting,
+            "max_concurrency": self._limiter.limit,
+        }
+
+
+model_client = ModelGateway(
+    OpenAIChatCompletionClient(
+        model=os.getenv("OPENAI_MODEL", "gpt-4-turbo"),
+        api_key=os.getenv("OPENAI_API_KEY"),
+        # Point at a local OpenAI-compatible server (e.g. a fake in tests)
+        base_url=os.getenv("OPENAI_BASE_URL") or None,
+        temperature=0.4,
+        max_tokens=1024,
+        timeout=float(os.getenv("MODEL_TIMEOUT", "30")),
+        max_retries=0,  # retries are handled by the gateway
+    )
 )
+register_stats("model", model_client.stats)
@@ -0,0 +1,212 @@
+"""
+Password hashing off the request threads.
+
+Hashes are computed in a small process pool so a burst of logins can't hold
+the GIL and starve chat traffic. The pool has a bounded backlog: when it is
+full, callers get ``HashingBusy`` immediately and should answer 503.
+
+PASSWORD_HASH_METHOD takes any werkzeug method string (``scrypt:N:r:p`` or
+``pbkdf2:sha256:iterations``); hashes made with other parameters are
+upgraded transparently on the next successful login.
+"""
+import atexit
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from typing import Callable, Tuple
+
+from werkzeug.security import (
+    DEFAULT_PBKDF2_ITERATIONS,
+    check_password_hash,
+    generate_password_hash,
+)
+
+from telemetry import register_stats
+
+logger = logging.getLogger(__name__)
+
+HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))  # 0 = hash inline
+MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+
+class HashingBusy(Exception):
+    """The hashing pool is saturated; retry later."""
+
+
+def canonical_method(method: str) -> str:
+    """
+    The method prefix werkzeug stores for ``method``, with its defaults
+    filled in ("scrypt" -> "scrypt:32768:8:1"), worked out without hashing.
+    """
+    name, *args = method.split(":")
+    if name == "scrypt" and not args:
+        return "scrypt:32768:8:1"
+    if name == "pbkdf2" and len(args) < 2:
+        hash_name = args[0] if args else "sha256"
+        return f"pbkdf2:{hash_name}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+def _hash(password: str, method: str) -> Tuple[str, float]:
+    start = time.process_time()
+    hashed = generate_password_hash(password, method=method)
+    return hashed, time.process_time() - start
+
+
+def _verify(hashed: str, password: str) -> Tuple[bool, float]:
+    start = time.process_time()
+    ok = check_password_hash(hashed, password)
+    return ok, time.process_time() - start
+
+
+class PasswordHasher:
+    def __init__(self,
+                 method: str = HASH_METHOD,
+                 workers: int = HASH_WORKERS,
+                 max_pending: int = MAX_PENDING,
+                 timeout: float = HASH_TIMEOUT):
+        self.method = method
+        self._prefix = canonical_method(method)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.hashes = 0
+        self.verifications = 0
+        self.rehashes = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.hash_seconds = 0.0  # CPU time inside the KDF
+        self.wait_seconds = 0.0  # request time spent waiting for a result
+
+    def _pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # forkserver: workers don't inherit this process's threads
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context(
+                    "forkserver" if "forkserver" in methods else "spawn"
+                )
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context
+                )
+            return self._executor
+
+    def _submit(self, fn: Callable, *args) -> concurrent.futures.Future:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise HashingBusy()
+            self.pending += 1
+        try:
+            future = self._pool().submit(fn, *args)
+        except Exception:
+            # Most likely a broken pool (a worker died); start a fresh one next time
+            with self._lock:
+                self.pending -= 1
+                self._executor = None
+            raise HashingBusy()
+        future.add_done_callback(self._finished)
+        return future
+
+    def _finished(self, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self.pending -= 1
+            if not future.cancelled() and future.exception() is None:
+                self.hash_seconds += future.result()[1]
+
+    def _run(self, fn: Callable, *args):
+        if self.workers <= 0:
+            result, seconds = fn(*args)
+            with self._lock:
+                self.hash_seconds += seconds
+            return result
+        start = time.perf_counter()
+        future = self._submit(fn, *args)
+        try:
+            return future.result(self.timeout)[0]
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise HashingBusy()
+        except concurrent.futures.BrokenExecutor:
+            with self._lock:
+                self._executor = None
+            raise HashingBusy()
+        finally:
+            with self._lock:
+                self.wait_seconds += time.perf_counter() - start
+
+    def hash(self, password: str) -> str:
+        with self._lock:
+            self.hashes += 1
+        return self._run(_hash, password, self.method)
+
+    def verify(self, hashed: str, password: str) -> bool:
+        with self._lock:
+            self.verifications += 1
+        return self._run(_verify, hashed, password)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True if ``hashed`` was made with other parameters than the configured ones."""
+        return hashed.split("$", 1)[0] != self._prefix
+
+    def rehash_later(self, password: str, save: Callable[[str], None]) -> None:
+        """
+        Hash ``password`` with the current parameters in the background and
+        hand the result to ``save``. Skipped when the pool is busy; the
+        next login will try again.
+        """
+        def done(future):
+            if future.cancelled() or future.exception() is not None:
+                return
+            try:
+                save(future.result()[0])
+                with self._lock:
+                    self.rehashes += 1
+            except Exception:
+                logger.exception("Failed to store rehashed password")
+
+        if self.workers <= 0:
+            save(self.hash(password))
+            with self._lock:
+                self.rehashes += 1
+            return
+        try:
+            self._submit(_hash, password, self.method).add_done_callback(done)
+        except HashingBusy:
+            pass
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "workers": self.workers,
+                "hashes": self.hashes,
+                "verifications": self.verifications,
+                "rehashes": self.rehashes,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "hash_seconds": self.hash_seconds,
+                "wait_seconds": self.wait_seconds,
+            }
+
+
+password_hasher = PasswordHasher()
+atexit.register(password_hasher.shutdown)
+register_stats("passwords", password_hasher.stats)
@@ -0,0 +1,287 @@
+"""
+Outfit picks computed ahead of the morning peak.
+
+Run once (e.g. from cron) with ``python precompute.py``, or keep it running
+with ``python precompute.py --daily-at 05:30``. Each run scores the
+wardrobes of recently active users:
+
+- users are grouped by the weather cell of their last-known location, so
+  weather is fetched once per cell
+- wear histories are loaded for a batch of users in one query
+- wardrobes, profiles and wear histories are loaded for a batch of users
+  with one query each
+- the formatted picks are stored in ``precomputed_recommendations`` with
+  the user's data versions and an expiry (TTL index); cells whose weather
+  can't be fetched get no picks
+
+``/chat`` answers a plain "what should I wear today?" from a stored pick
+while it is still current (computed today, not expired, same weather
+cell, no wardrobe, wear or feedback writes since), and seeds the agent's
+recommendation context with it otherwise.
+"""
+import argparse
+import logging
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from pymongo import ReplaceOne
+
+from db import users_collection, precomputed_collection, ensure_indexes
+from fast_path import normalize
+from preferences import bulk_profiles, garment_preferences
+from recommender import (
+    bulk_load_wardrobes,
+    bulk_recency_penalties,
+    score_candidates,
+    format_recommendations,
+)
+from response_cache import WARDROBE, RECENT, FEEDBACK
+from state_store import data_versions
+from telemetry import register_stats
+from weather import weather_service
+from write_behind import write_behind
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_DAYS = int(os.getenv("PRECOMPUTE_ACTIVE_DAYS", "7"))
+TTL_HOURS = float(os.getenv("PRECOMPUTE_TTL_HOURS", "6"))
+BATCH_SIZE = int(os.getenv("PRECOMPUTE_BATCH_SIZE", "200"))
+TOP_K = 3
+# Last-known locations are rewritten at most this often per user and cell
+LOCATION_REFRESH_SECONDS = 3600
+
+# Matched against the whole (normalized) message; anything more specific
+# ("...for a wedding") goes to the agent.
+DAILY_ASK = re.compile(
+    r"^(what (should|can|do) i wear|what to wear)( today| this morning)?( please)?$"
+    r"|^(please )?(recommend|suggest|pick)( me)? (an |my )?outfit( for)?( today)?( please)?$"
+)
+
+
+def _versions(current: Dict[str, int]) -> List[int]:
+    # From Mongo, not the response cache: its counters may be per process
+    return [current.get(kind, 0) for kind in (WARDROBE, RECENT, FEEDBACK)]
+
+
+def _utc(when: datetime) -> datetime:
+    return when if when.tzinfo else when.replace(tzinfo=timezone.utc)
+
+
+def _coords(location: Optional[Dict[str, Any]]) -> Optional[Tuple[float, float]]:
+    if not location:
+        return None
+    try:
+        return float(location["latitude"]), float(location["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class PrecomputedPicks:
+    """Stored picks per user, plus the last-known locations the batch reads."""
+
+    def __init__(self, collection=precomputed_collection):
+        self.collection = collection
+        self._recorded = {}  # username -> (cell, monotonic time written)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def remember_location(self, username: str, location: Optional[Dict[str, Any]]) -> None:
+        """Record the user's location and activity (written behind, throttled)."""
+        coords = _coords(location)
+        if coords is None:
+            return
+        cell = weather_service.cell(*coords)
+        now = time.monotonic()
+        with self._lock:
+            last = self._recorded.get(username)
+            if last and last[0] == cell and now - last[1] < LOCATION_REFRESH_SECONDS:
+                return
+            self._recorded[username] = (cell, now)
+        write_behind.update(
+            "users",
+            {"username": username},
+            {"$set": {
+                "last_location": {"latitude": coords[0], "longitude": coords[1]},
+                "last_seen": datetime.now(timezone.utc),
+            }},
+        )
+
+    def lookup(self, username: str, location: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """The stored reply if it is still current for ``location``, else None."""
+        doc = self.collection.find_one(
+            {"_id": username},
+            {"reply": 1, "cell": 1, "versions": 1, "computed_at": 1, "expires_at": 1},
+        )
+        if doc is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        now = datetime.now(timezone.utc)
+        coords = _coords(location)
+        current = (
+            _utc(doc["expires_at"]) > now
+            # Yesterday's pick was made for yesterday's weather
+            and _utc(doc["computed_at"]).date() == now.date()
+            and (coords is None or tuple(doc["cell"]) == weather_service.cell(*coords))
+            and doc["versions"] == _versions(data_versions.get(username))
+        )
+        with self._lock:
+            if current:
+                self.hits += 1
+            else:
+                self.stale += 1
+        return doc["reply"] if current else None
+
+    def answer(self, username: str, message: str,
+               location: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """Serve a plain daily ask from the stored picks; None otherwise."""
+        if not DAILY_ASK.match(normalize(message)):
+            return None
+        return self.lookup(username, location)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "stale": self.stale}
+
+
+precomputed = PrecomputedPicks()
+register_stats("precomputed", precomputed.stats)
+
+
+def active_users_by_cell(now: datetime) -> Dict[Tuple[float, float], List[str]]:
+    """Users seen in the last ACTIVE_DAYS, grouped by their weather cell."""
+    cells = defaultdict(list)
+    for user in users_collection.find(
+        {"last_seen": {"$gte": now - timedelta(days=ACTIVE_DAYS)},
+         "last_location": {"$exists": True}},
+        {"_id": 0, "username": 1, "last_location": 1},
+    ):
+        coords = _coords(user["last_location"])
+        if coords is not None:
+            cells[weather_service.cell(*coords)].append(user["username"])
+    return cells
+
+
+def precompute_cell(cell: Tuple[float, float],
+                    usernames: List[str],
+                    now: datetime,
+                    expires_at: datetime) -> int:
+    """Score and store picks for the users of one cell; returns how many were stored."""
+    try:
+        weather = weather_service.get(*cell)
+    except (requests.RequestException, ValueError) as e:
+        # A pick that ignores the weather is worse than none; /chat asks the agent
+        logger.warning("Skipping cell %s, failed to fetch weather: %s", cell, e)
+        return 0
+
+    stored = 0
+    for start in range(0, len(usernames), BATCH_SIZE):
+        batch = usernames[start:start + BATCH_SIZE]
+        # Read versions first: a write during scoring makes the pick stale, never wrong
+        versions = {
+            username: _versions(current)
+            for username, current in data_versions.get_many(batch).items()
+        }
+        wardrobes = bulk_load_wardrobes(batch)
+        profiles = bulk_profiles(batch, now)
+        recency = bulk_recency_penalties(batch, now)
+        ops = []
+        for username in batch:
+            try:
+                items = wardrobes[username]
+                ranked = score_candidates(
+                    items,
+                    weather["feels_like"],
+                    recency[username],
+                    garment_preferences(profiles[username], items),
+                    top_k=TOP_K,
+                )
+            except Exception:
+                logger.exception("Failed to precompute picks for %s", username)
+                continue
+            if not ranked:
+                continue
+            ops.append(ReplaceOne(
+                {"_id": username},
+                {
+                    "cell": list(cell),
+                    "reply": format_recommendations(username, ranked, weather),
+                    "versions": versions[username],
+                    "computed_at": now,
+                    "expires_at": expires_at,
+                },
+                upsert=True,
+            ))
+        if ops:
+            precomputed_collection.bulk_write(ops, ordered=False)
+            stored += len(ops)
+    return stored
+
+
+def run_batch(now: Optional[datetime] = None) -> dict:
+    """Precompute picks for every active user; returns a summary."""
+    start = time.perf_counter()
+    now = now or datetime.now(timezone.utc)
+    expires_at = now + timedelta(hours=TTL_HOURS)
+    cells = active_users_by_cell(now)
+    stored = 0
+    for cell, usernames in cells.items():
+        stored += precompute_cell(cell, usernames, now, expires_at)
+    return {
+        "cells": len(cells),
+        "users": sum(len(usernames) for usernames in cells.values()),
+        "stored": stored,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def seconds_until(at: str) -> float:
+    """Seconds until the next local ``HH:MM``."""
+    hour, minute = map(int, at.split(":"))
+    now = datetime.now()
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+def _clock_time(value: str) -> str:
+    try:
+        hour, minute = map(int, value.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected HH:MM")
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise argparse.ArgumentTypeError("expected HH:MM")
+    return value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute outfit picks for active users.")
+    parser.add_argument("--daily-at", type=_clock_time, metavar="HH:MM",
+                        help="keep running and precompute every day at this local time")
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    ensure_indexes()
+    while True:
+        if args.daily_at:
+            time.sleep(seconds_until(args.daily_at))
+        summary = run_batch()
+        print(
+            f"✅ Precomputed picks for {summary['stored']} of {summary['users']} user(s) "
+            f"in {summary['cells']} weather cell(s) ({summary['seconds']:.1f}s)."
+        )
+        if not args.daily_at:
+            break
@@ -0,0 +1,178 @@
+"""
+Incrementally maintained per-user preference profiles.
+
+Every feedback write bumps per-attribute like/dislike/normal counters and a
+time-decayed score in one ``user_preferences`` document, so readers never
+re-scan ``user_feedbacks``.
+
+Decayed scores are stored scaled by ``2 ** (t / HALF_LIFE)`` relative to a
+fixed epoch, which keeps each update a plain atomic ``$inc``; dividing by the
+same factor at read time yields the decayed value.
+
+Run ``python preferences.py [username]`` to rebuild profiles from existing
+feedback.
+"""
+import math
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from db import feedback_collection, preferences_collection
+from wardrobe_index import normalize_item
+from write_behind import write_behind
+
+HALF_LIFE_DAYS = 30.0
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+FEEDBACK_WEIGHTS = {"like": 1.0, "dislike": -1.5, "normal": 0.0}
+
+
+def _growth(when: datetime) -> float:
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    days = (when - EPOCH).total_seconds() / 86400
+    return 2.0 ** (days / HALF_LIFE_DAYS)
+
+
+def _field(value: str) -> str:
+    # Mongo field names may not contain "." or start with "$".
+    return value.replace(".", "_").replace("$", "_")
+
+
+def garment_attribute(type_: str, color: str) -> str:
+    return _field(f"garment:{type_}|{color}")
+
+
+def attributes(piece: dict) -> List[str]:
+    """Attribute keys a garment contributes to the profile."""
+    item = normalize_item(piece)
+    keys = [
+        garment_attribute(item["type"], item["color"]),
+        _field(f"type:{item['type']}"),
+        _field(f"color:{item['color']}"),
+        _field(f"color_family:{item['color_family']}"),
+        _field(f"category:{item['category']}"),
+    ]
+    if item["style"]:
+        keys.append(_field(f"style:{item['style']}"))
+    return keys
+
+
+def _increments(suggested_outfit: list, feedback: str, when: datetime) -> Dict[str, float]:
+    weight = FEEDBACK_WEIGHTS.get(feedback, 0.0) * _growth(when)
+    inc: Dict[str, float] = {"total": 1}
+    for piece in suggested_outfit or []:
+        if not isinstance(piece, dict):
+            continue
+        for key in set(attributes(piece)):
+            inc[f"counts.{key}.{feedback}"] = inc.get(f"counts.{key}.{feedback}", 0) + 1
+            if weight:
+                inc[f"scores.{key}"] = inc.get(f"scores.{key}", 0.0) + weight
+    return inc
+
+
+def record_feedback(username: str,
+                    suggested_outfit: list,
+                    feedback: str,
+                    when: Optional[datetime] = None) -> None:
+    """Fold one feedback event into the user's profile with a single atomic update."""
+    when = when or datetime.now(timezone.utc)
+    write_behind.update(
+        preferences_collection.name,
+        {"username": username},
+        {
+            "$inc": _increments(suggested_outfit, feedback, when),
+            "$max": {"updated_at": when},
+        },
+        upsert=True,
+    )
+
+
+def load_profile(username: str, now: Optional[datetime] = None) -> Dict[str, dict]:
+    """
+    Returns:
+    - {attribute: {"like": n, "dislike": n, "normal": n, "score": decayed}}
+    """
+    return _profile(preferences_collection.find_one({"username": username}, {"_id": 0}), now)
+
+
+def bulk_profiles(usernames: List[str], now: Optional[datetime] = None) -> Dict[str, Dict[str, dict]]:
+    """``load_profile`` for many users with a single query."""
+    profiles = {username: {} for username in usernames}
+    for doc in preferences_collection.find({"username": {"$in": list(usernames)}}, {"_id": 0}):
+        profiles[doc["username"]] = _profile(doc, now)
+    return profiles
+
+
+def _profile(doc: Optional[dict], now: Optional[datetime] = None) -> Dict[str, dict]:
+    if not doc:
+        return {}
+
+    scale = _growth(now or datetime.now(timezone.utc))
+    profile = {}
+    for key, counts in doc.get("counts", {}).items():
+        profile[key] = {
+            "like": counts.get("like", 0),
+            "dislike": counts.get("dislike", 0),
+            "normal": counts.get("normal", 0),
+            "score": doc.get("scores", {}).get(key, 0.0) / scale,
+        }
+    return profile
+
+
+def garment_preferences(profile: Dict[str, dict], items: List[dict]) -> Dict[Tuple[str, str], float]:
+    """Preference in (-1, 1) for each wardrobe item, keyed by (type, color)."""
+    def score(key):
+        return profile.get(_field(key), {}).get("score", 0.0)
+
+    prefs = {}
+    for item in items:
+        raw = (
+            score(f"garment:{item['type']}|{item['color']}")
+            + 0.5 * score(f"type:{item['type']}")
+            + 0.3 * score(f"color_family:{item.get('color_family')}")
+        )
+        if item.get("style"):
+            raw += 0.3 * score(f"style:{item['style']}")
+        if raw:
+            prefs[(item["type"], item["color"])] = math.tanh(raw / 2)
+    return prefs
+
+
+def summarize_profile(profile: Dict[str, dict], top: int = 5) -> str:
+    """Short text summary of the strongest likes and dislikes."""
+    ranked = sorted(
+        ((v["score"], k) for k, v in profile.items()
+         if not k.startswith("garment:") and abs(v["score"]) >= 0.25),
+        reverse=True,
+    )
+    likes = [k for s, k in ranked[:top] if s > 0]
+    dislikes = [k for s, k in reversed(ranked[-top:]) if s < 0]
+    if not likes and not dislikes:
+        return ""
+    lines = []
+    if likes:
+        lines.append("Tends to like: " + ", ".join(likes))
+    if dislikes:
+        lines.append("Tends to dislike: " + ", ".join(dislikes))
+    return "\n".join(lines)
+
+
+def rebuild_profiles(username: Optional[str] = None) -> int:
+    """Rebuild profiles from ``user_feedbacks``. Returns feedback events folded in."""
+    query = {"username": username} if username else {}
+    preferences_collection.delete_many(query)
+    count = 0
+    for doc in feedback_collection.find(query).sort("timestamp", 1):
+        record_feedback(
+            doc["username"],
+            doc.get("suggested_outfit", []),
+            doc.get("feedback", "normal"),
+            doc.get("timestamp"),
+        )
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    count = rebuild_profiles(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"✅ Rebuilt preferences from {count} feedback record(s).")
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import re
+from typing import Any, Dict, Optional
+
+from function_tools import (
+    retrieve_user_outfit,
+    recently_worn_garments,
+    get_weather_by_coords,
+    for_model,
+)
+from precompute import precomputed
+from preferences import load_profile, summarize_profile
+
+logger = logging.getLogger(__name__)
+
+RECENT_DAYS = 10
+
+RECOMMENDATION_INTENT = re.compile(
+    r"\b("
+    r"what (should|can|could|do) i wear"
+    r"|what to wear"
+    r"|recommend\w*"
+    r"|suggest\w*"
+    r"|pick (an |my )?outfit"
+    r"|outfit (for|ideas?)"
+    r"|dress for"
+    r")\b",
+    re.IGNORECASE,
+)
+
+
+def wants_recommendation(message: str) -> bool:
+    """Cheap check for messages that ask for an outfit recommendation."""
+    return bool(RECOMMENDATION_INTENT.search(message or ""))
+
+
+async def build_recommendation_context(username: str,
+                                       location: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Fetch wardrobe, recently worn garments, weather, the preference summary
+    and any still-current precomputed picks concurrently and render them as
+    one context block, so the model can recommend without calling the
+    lookup tools one after another.
+
+    Parameters:
+    - username: unique identifier of the user
+    - location: dict with "latitude" and "longitude" (may be None)
+
+    Returns:
+    - Context text to prepend to the user's message
+    """
+    lookups = {
+        "Saved wardrobe": asyncio.to_thread(for_model(retrieve_user_outfit), username),
+        f"Worn in the last {RECENT_DAYS} days": asyncio.to_thread(
+            for_model(recently_worn_garments), username, RECENT_DAYS
+        ),
+    }
+    if location and "latitude" in location and "longitude" in location:
+        lookups["Current weather"] = asyncio.to_thread(
+            get_weather_by_coords, location["latitude"], location["longitude"]
+        )
+    lookups["Style preferences"] = asyncio.to_thread(
+        lambda: summarize_profile(load_profile(username))
+    )
+    lookups["Picks computed earlier today (still current)"] = asyncio.to_thread(
+        precomputed.lookup, username, location
+    )
+
+    results = await asyncio.gather(*lookups.values(), return_exceptions=True)
+
+    sections = []
+    for title, result in zip(lookups, results):
+        if isinstance(result, Exception):
+            logger.warning("Failed to prefetch '%s': %s", title, result)
+            continue
+        if not result:
+            continue
+        sections.append(f"### {title}\n{result}")
+
+    if not sections:
+        return ""
+
+    return (
+        "[Recommendation context — already fetched for this message. Use it "
+        "instead of calling retrieve_user_outfit, recently_worn_garments or "
+        "get_weather_tool.]\n\n" + "\n\n".join(sections)
+    )
+
+
+async def with_recommendation_context(task: str,
+                                      username: str,
+                                      location: Optional[Dict[str, Any]] = None) -> str:
+    """Return ``task`` with prefetched context prepended when it asks for a recommendation."""
+    if not wants_recommendation(task):
+        return task
+    context = await build_recommendation_context(username, location)
+    if not context:
+        return task
+    return f"{context}\n\n### User message\n{task}"
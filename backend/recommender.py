@@ -0,0 +1,220 @@
+import itertools
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from db import wardrobe_items_collection
+from wardrobe_index import COLOR_FAMILIES
+from preferences import load_profile, garment_preferences
+from wear_history import load_wear_history, bulk_wear_history
+
+MAX_ITEMS = 300
+SLOT_WIDTH = 8
+RECENT_DAYS = 10
+
+WEATHER_WEIGHT = 1.0
+RECENCY_WEIGHT = 2.0
+RECENCY_HALF_LIFE_DAYS = 3.0
+FEEDBACK_WEIGHT = 1.0
+CLASH_PENALTY = 0.75
+
+NEUTRAL = "neutral"
+FAMILY_CODES = {family: code for code, family in enumerate([*COLOR_FAMILIES, "other"])}
+
+# (required categories, optional categories) for each outfit shape.
+LAYOUTS = (
+    (("top", "bottom"), ("outerwear", "footwear")),
+    (("dress",), ("outerwear", "footwear")),
+)
+
+
+def target_warmth(feels_like: Optional[float]) -> Optional[float]:
+    """Total outfit warmth (sum of item warmth) that suits the temperature."""
+    if feels_like is None:
+        return None
+    return float(np.clip((30.0 - feels_like) / 3.5 + 4.0, 3.0, 14.0))
+
+
+def _slot(ranked: List[int], warmth: np.ndarray) -> List[int]:
+    """
+    Up to SLOT_WIDTH items of one category, best first: the best item of
+    each warmth level, then the next best overall. Whatever the weather, an
+    item of suitable warmth is among the candidates.
+    """
+    picked, levels = [], set()
+    for i in ranked:
+        if warmth[i] not in levels:
+            levels.add(warmth[i])
+            picked.append(i)
+    for i in ranked:
+        if len(picked) >= SLOT_WIDTH:
+            break
+        if i not in picked:
+            picked.append(i)
+    picked = picked[:SLOT_WIDTH]
+    order = {i: rank for rank, i in enumerate(ranked)}
+    return sorted(picked, key=order.get)
+
+
+ITEM_FIELDS = {"_id": 0, "type": 1, "color": 1, "style": 1, "category": 1,
+               "color_family": 1, "warmth": 1}
+
+
+def _unique(items) -> List[dict]:
+    unique = {}
+    for item in items:
+        unique.setdefault((item["type"], item["color"], item.get("style")), item)
+    return list(unique.values())
+
+
+def load_wardrobe(username: str) -> List[dict]:
+    return _unique(
+        wardrobe_items_collection.find({"username": username}, ITEM_FIELDS)
+        .sort("timestamp", -1)
+        .limit(MAX_ITEMS)
+    )
+
+
+def bulk_load_wardrobes(usernames: List[str]) -> Dict[str, List[dict]]:
+    """``load_wardrobe`` for many users with a single query."""
+    rows = {username: [] for username in usernames}
+    for item in wardrobe_items_collection.find(
+        {"username": {"$in": list(usernames)}}, {**ITEM_FIELDS, "username": 1}
+    ).sort([("username", 1), ("timestamp", -1)]):
+        user_rows = rows[item.pop("username")]
+        if len(user_rows) < MAX_ITEMS:
+            user_rows.append(item)
+    return {username: _unique(items) for username, items in rows.items()}
+
+
+def recency_penalties(username: str, now: Optional[datetime] = None) -> Dict[Tuple[str, str], float]:
+    """Penalty per garment, halving every RECENCY_HALF_LIFE_DAYS since it was worn."""
+    return penalties_from_history(load_wear_history(username), now)
+
+
+def bulk_recency_penalties(usernames: List[str],
+                           now: Optional[datetime] = None) -> Dict[str, Dict[Tuple[str, str], float]]:
+    """``recency_penalties`` for many users with a single query."""
+    return {
+        username: penalties_from_history(history, now)
+        for username, history in bulk_wear_history(usernames).items()
+    }
+
+
+def penalties_from_history(history: Dict[Tuple[str, str], dict],
+                           now: Optional[datetime] = None) -> Dict[Tuple[str, str], float]:
+    now = now or datetime.now(timezone.utc)
+    penalties = {}
+    for key, entry in history.items():
+        days = max(0.0, (now - entry["last_worn"]).total_seconds() / 86400)
+        if days <= RECENT_DAYS:
+            penalties[key] = 0.5 ** (days / RECENCY_HALF_LIFE_DAYS)
+    return penalties
+
+
+def score_candidates(items: List[dict],
+                     feels_like: Optional[float],
+                     recency: Dict[Tuple[str, str], float],
+                     preference: Dict[Tuple[str, str], float],
+                     top_k: int = 3) -> List[Tuple[float, List[dict]]]:
+    """
+    Build candidate outfits from the wardrobe and score them in one pass.
+
+    Returns:
+    - Up to ``top_k`` (score, items) pairs, best first
+    """
+    if not items:
+        return []
+
+    n = len(items)
+    # Index n is a zero "no item" pad used by optional slots.
+    warmth = np.zeros(n + 1)
+    pref = np.zeros(n + 1)
+    worn = np.zeros(n + 1)
+    colors = np.zeros((n + 1, len(FAMILY_CODES)), dtype=bool)
+    for i, item in enumerate(items):
+        key = (item["type"], item["color"])
+        warmth[i] = item.get("warmth", 2)
+        pref[i] = preference.get(key, 0.0)
+        worn[i] = recency.get(key, 0.0)
+        family = item.get("color_family", "other")
+        if family != NEUTRAL:
+            colors[i, FAMILY_CODES.get(family, FAMILY_CODES["other"])] = True
+
+    item_score = FEEDBACK_WEIGHT * pref[:n] - RECENCY_WEIGHT * worn[:n]
+    by_category: Dict[str, List[int]] = {}
+    for i in np.argsort(-item_score, kind="stable"):
+        by_category.setdefault(items[i]["category"], []).append(int(i))
+
+    by_category = {c: _slot(ranked, warmth) for c, ranked in by_category.items()}
+
+    rows = []
+    for required, optional in LAYOUTS:
+        slots = [by_category.get(c, []) for c in required]
+        if not all(slots):
+            continue
+        slots += [by_category.get(c, []) + [n] for c in optional]
+        rows.extend(itertools.product(*slots))
+    if not rows:
+        return []
+
+    width = max(len(r) for r in rows)
+    candidates = np.full((len(rows), width), n)
+    for r, row in enumerate(rows):
+        candidates[r, :len(row)] = row
+
+    scores = (
+        FEEDBACK_WEIGHT * pref[candidates].sum(axis=1)
+        - RECENCY_WEIGHT * worn[candidates].sum(axis=1)
+    )
+    target = target_warmth(feels_like)
+    if target is not None:
+        scores -= WEATHER_WEIGHT * np.abs(warmth[candidates].sum(axis=1) - target)
+    families = colors[candidates].any(axis=1).sum(axis=1)
+    scores -= CLASH_PENALTY * np.maximum(families - 2, 0)
+
+    k = min(top_k, len(rows))
+    best = np.argpartition(-scores, k - 1)[:k]
+    best = best[np.argsort(-scores[best], kind="stable")]
+    return [
+        (float(scores[r]), [items[i] for i in candidates[r] if i != n])
+        for r in best
+    ]
+
+
+def recommend(username: str,
+              feels_like: Optional[float] = None,
+              top_k: int = 3) -> List[Tuple[float, List[dict]]]:
+    items = load_wardrobe(username)
+    return score_candidates(
+        items,
+        feels_like,
+        recency_penalties(username),
+        garment_preferences(load_profile(username), items),
+        top_k=top_k,
+    )
+
+
+def format_recommendations(username: str,
+                           ranked: List[Tuple[float, List[dict]]],
+                           weather: Optional[dict] = None) -> str:
+    if not ranked:
+        return "👕 I couldn't put together an outfit yet — try adding a top and a bottom (or a dress) to your wardrobe!"
+
+    lines = [f"👚 Top outfit picks for {username}:"]
+    if weather:
+        lines.append(
+            f"(Weather: {weather['description']}, feels like {weather['feels_like']:.1f} °C)"
+        )
+    lines.append("")
+    # Scores are internal (and usually negative); only the compact model output keeps them
+    for idx, (_, pieces) in enumerate(ranked, start=1):
+        lines.append(f"🧥 Option {idx}:")
+        for piece in pieces:
+            desc = f" - {piece.get('color', 'unknown')} {piece.get('type', 'item')}"
+            if piece.get("style"):
+                desc += f" ({piece['style']})"
+            lines.append(desc)
+        lines.append("")
+    return "\n".join(lines).strip()
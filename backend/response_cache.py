@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, Hashable
+
+from state_store import data_versions, SHARED
+from telemetry import register_stats
+
+WARDROBE = "wardrobe"
+RECENT = "recent"
+FEEDBACK = "feedback"
+
+TTL = float(os.getenv("RESPONSE_CACHE_TTL", "300"))
+MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+
+
+class ResponseCache:
+    """
+    Rendered tool output cached per user and data kind.
+
+    Each (username, kind) has a version that store tools bump on write;
+    entries rendered under an older version are treated as misses. With
+    ``shared_versions`` (see state_store) the versions live in Mongo so
+    writes on any worker invalidate entries on all of them. Otherwise they
+    are counted in the process and, with ``persisted_versions``, also bumped
+    in Mongo for readers outside it.
+    """
+
+    def __init__(self, ttl: float = TTL, max_entries: int = MAX_ENTRIES,
+                 shared_versions=None, persisted_versions=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (version, text, expires_at)
+        self._versions = defaultdict(int)
+        self._shared = shared_versions
+        self._persisted = shared_versions or persisted_versions
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, username: str, kind: str) -> int:
+        if self._shared is not None:
+            return self._shared.get(username).get(kind, 0)
+        with self._lock:
+            return self._versions[(username, kind)]
+
+    def versions(self, username: str) -> tuple:
+        """Wardrobe, recent and feedback versions in one lookup."""
+        if self._shared is not None:
+            current = self._shared.get(username)
+            return tuple(current.get(kind, 0) for kind in (WARDROBE, RECENT, FEEDBACK))
+        with self._lock:
+            return tuple(self._versions[(username, kind)] for kind in (WARDROBE, RECENT, FEEDBACK))
+
+    def invalidate(self, username: str, kind: str) -> None:
+        if self._persisted is not None:
+            self._persisted.bump(username, kind)
+        if self._shared is not None:
+            return
+        with self._lock:
+            self._versions[(username, kind)] += 1
+
+    def get_or_render(self, username: str, kind: str, args: Hashable,
+                      render: Callable[[], str],
+                      cacheable: Callable[[str], bool] = lambda text: True) -> str:
+        key = (username, kind, args)
+        now = time.monotonic()
+        version = self.version(username, kind)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        text = render()
+        if not cacheable(text):
+            return text
+
+        # Only cache if no write happened while rendering; an entry stored
+        # under a version that was bumped right after is simply a miss later
+        if self.version(username, kind) == version:
+            with self._lock:
+                self._entries[key] = (version, text, time.monotonic() + self.ttl)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return text
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache(
+    shared_versions=data_versions if SHARED else None,
+    persisted_versions=data_versions,
+)
+register_stats("response_cache", response_cache.stats)
+
+
+def invalidate(username: str, kind: str) -> None:
+    response_cache.invalidate(username, kind)
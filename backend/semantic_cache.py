@@ -0,0 +1,118 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from response_cache import response_cache
+from telemetry import register_stats
+from weather import weather_service
+
+TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "1800"))
+MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+MAX_ENTRIES_PER_USER = 20
+
+# Tools whose use means the reply depended on (or changed) state we can't key on
+WRITE_TOOLS = {"store_user_outfit", "store_worn_outfits", "save_outfit_feedback"}
+
+# Filler only: negations and qualifiers ("with", "without", "no", "not") and
+# occasion words change the answer, so they stay in the key
+STOPWORDS = {
+    "a", "an", "the", "i", "me", "my", "you", "your", "should", "could", "would",
+    "can", "do", "does", "is", "are", "am", "be", "to", "for", "of", "on", "in",
+    "it", "this", "that", "please", "pls", "hey", "hi", "hello", "so", "just",
+    "any", "some", "what", "whats", "which", "how", "about", "maybe", "um",
+    "give", "tell", "idea", "ideas", "and", "now",
+}
+SYNONYMS = {
+    "outfit": "wear", "outfits": "wear", "wearing": "wear", "dress": "wear",
+    "clothes": "wear", "put": "wear", "fit": "wear", "fits": "wear",
+    "suggest": "recommend", "suggestion": "recommend", "suggestions": "recommend",
+    "recommendation": "recommend", "recommendations": "recommend", "pick": "recommend",
+    "tonight": "today", "morning": "today", "afternoon": "today",
+}
+
+
+def normalize(message: str) -> frozenset:
+    """Order-insensitive bag of meaningful words after synonym folding."""
+    words = re.findall(r"[a-z0-9]+", (message or "").lower())
+    return frozenset(
+        SYNONYMS.get(word, word) for word in words if word not in STOPWORDS
+    )
+
+
+def fingerprint(username: str, location: Optional[Dict[str, Any]] = None) -> tuple:
+    """State the answer depends on: data versions, weather cell and the date."""
+    cell = None
+    if location and "latitude" in location and "longitude" in location:
+        cell = weather_service.cell(location["latitude"], location["longitude"])
+    return (
+        *response_cache.versions(username),
+        cell,
+        datetime.now(timezone.utc).date().isoformat(),
+    )
+
+
+class SemanticCache:
+    """
+    Per-user cache of model replies keyed on normalized text plus a state
+    fingerprint. Questions match when their word bags are equal, so
+    reordering, filler and synonyms still hit but an added qualifier misses.
+    Only use it for the opening question of a session: the reply must not
+    depend on earlier turns.
+    """
+
+    def __init__(self, ttl: float = TTL, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # (username, words, state) -> (reply, expires_at)
+        self._by_user: Dict[str, OrderedDict] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username: str, message: str, state: tuple) -> Optional[str]:
+        key = (username, normalize(message), state)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                reply, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return reply
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, username: str, message: str, state: tuple, reply: str) -> None:
+        key = (username, normalize(message), state)
+        with self._lock:
+            self._entries[key] = (reply, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            user_keys = self._by_user.setdefault(username, OrderedDict())
+            user_keys[key] = None
+            user_keys.move_to_end(key)
+            while len(user_keys) > MAX_ENTRIES_PER_USER:
+                self._remove(next(iter(user_keys)))
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key) -> None:
+        self._entries.pop(key, None)
+        user_keys = self._by_user.get(key[0])
+        if user_keys is not None:
+            user_keys.pop(key, None)
+            if not user_keys:
+                del self._by_user[key[0]]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+semantic_cache = SemanticCache()
+register_stats("semantic_cache", semantic_cache.stats)
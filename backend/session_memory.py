@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import os
+from typing import List, Optional
+
+from autogen_core.memory import (
+    ListMemory,
+    MemoryContent,
+    MemoryQueryResult,
+    UpdateContextResult,
+)
+from autogen_core.model_context import BufferedChatCompletionContext
+from autogen_core.models import (
+    FunctionExecutionResultMessage,
+    LLMMessage,
+    SystemMessage,
+    UserMessage,
+)
+from bson import ObjectId
+
+from db import sessions_collection
+from chat_history import fetch_messages, fetch_range
+from model_client import model_client, priority, BACKGROUND
+from telemetry import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+MAX_MESSAGE_TOKENS = int(os.getenv("HISTORY_MAX_MESSAGE_TOKENS", "300"))
+HISTORY_FETCH_LIMIT = 30
+RECENT_WINDOW = 10
+SUMMARY_BATCH = 10
+SUMMARY_MAX_TOKENS = 300
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a chat between a user and an outfit "
+    "recommendation assistant. Merge the new messages into the existing "
+    "summary. Keep user preferences, wardrobe facts and decisions; drop "
+    "small talk. Answer with the updated summary only, at most 150 words."
+)
+
+_summarizing = set()
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rstrip() + " …"
+
+
+def load_session_history(session_id: str) -> Optional[dict]:
+    """Fetch the session with only its newest HISTORY_FETCH_LIMIT messages."""
+    session = sessions_collection.find_one(
+        {"_id": ObjectId(session_id)}, {"user_id": 1, "summary": 1}
+    )
+    if session is not None:
+        session["messages"], _ = fetch_messages(session_id, limit=HISTORY_FETCH_LIMIT)
+    return session
+
+
+def load_summary(session_id: str) -> Optional[str]:
+    """The session's current rolling summary, if any."""
+    session = sessions_collection.find_one({"_id": ObjectId(session_id)}, {"summary": 1})
+    return (session or {}).get("summary")
+
+
+def budget_history(session: Optional[dict],
+                   budget: int = HISTORY_TOKEN_BUDGET) -> List[MemoryContent]:
+    """
+    Pick as many recent messages as fit the budget left after the rolling
+    summary (which the model context carries itself, see
+    ``BoundedChatCompletionContext.set_summary``).
+
+    Returns:
+        MemoryContent items in chronological order
+    """
+    if not session:
+        return []
+
+    budget -= estimate_tokens(session.get("summary"))
+    recent = []
+    for msg in reversed(session.get("messages", [])):
+        text = truncate_to_tokens(msg.get("content") or "", MAX_MESSAGE_TOKENS)
+        cost = estimate_tokens(text)
+        if cost > budget:
+            break
+        budget -= cost
+        recent.append(
+            MemoryContent(
+                content=f"{msg['role']}: {text}",
+                mime_type="text/plain",
+                metadata={"role": msg["role"]},
+            )
+        )
+
+    return recent[::-1]
+
+
+class BoundedChatCompletionContext(BufferedChatCompletionContext):
+    """
+    Buffered model context that also forgets messages outside the buffer
+    and keeps earlier turns within a token budget.
+
+    BufferedChatCompletionContext only limits what the model sees; its list
+    (and so the agent's saved state) keeps every message of the session.
+    Trimming on every add keeps cached agents and stored state a fixed size.
+
+    The model sees the rolling summary, the current turn in full and as
+    many of the earlier messages as fit ``token_budget`` with the summary.
+    """
+
+    def __init__(self, buffer_size: int, token_budget: int = HISTORY_TOKEN_BUDGET):
+        super().__init__(buffer_size=buffer_size)
+        self._token_budget = token_budget
+        self._summary: Optional[str] = None
+
+    def set_summary(self, summary: Optional[str]) -> None:
+        """Rolling summary to put ahead of the messages (not part of the saved state)."""
+        self._summary = summary
+
+    async def get_messages(self) -> List[LLMMessage]:
+        # The current turn starts at the newest user message
+        start = len(self._messages)
+        for index in range(len(self._messages) - 1, -1, -1):
+            if isinstance(self._messages[index], UserMessage):
+                start = index
+                break
+        budget = self._token_budget - estimate_tokens(self._summary)
+        while start > 0:
+            cost = estimate_tokens(str(self._messages[start - 1].content))
+            if cost > budget:
+                break
+            budget -= cost
+            start -= 1
+        messages = self._messages[start:]
+        while messages and isinstance(messages[0], FunctionExecutionResultMessage):
+            messages = messages[1:]
+        if self._summary:
+            messages = [
+                SystemMessage(content=f"Summary of earlier conversation: {self._summary}"),
+                *messages,
+            ]
+        return messages
+
+    async def add_message(self, message) -> None:
+        await super().add_message(message)
+        self._trim()
+
+    async def load_state(self, state) -> None:
+        await super().load_state(state)
+        self._trim()
+
+    def _trim(self) -> None:
+        messages = self._messages[-self._buffer_size:]
+        # Never start with a tool result whose call was dropped
+        while messages and isinstance(messages[0], FunctionExecutionResultMessage):
+            messages = messages[1:]
+        self._messages = messages
+
+
+class SessionHistoryMemory(ListMemory):
+    """
+    ListMemory holding the budgeted history of a session.
+
+    History is injected into the model context only on the first run after
+    the agent is built; later turns are already in the agent's own context.
+    The rolling summary is re-read on every run, since it is updated in the
+    background (possibly by another worker) while the agent stays cached.
+    """
+
+    def __init__(self, session_id: str, contents: List[MemoryContent]):
+        super().__init__(name=f"history_{session_id}", memory_contents=contents)
+        self._session_id = session_id
+        self._injected = False
+
+    async def update_context(self, model_context) -> UpdateContextResult:
+        if isinstance(model_context, BoundedChatCompletionContext):
+            model_context.set_summary(
+                await asyncio.to_thread(load_summary, self._session_id)
+            )
+        if self._injected:
+            return UpdateContextResult(memories=MemoryQueryResult(results=[]))
+        self._injected = True
+        return await super().update_context(model_context)
+
+
+async def update_summary(session_id: str) -> None:
+    """
+    Fold messages older than the recent window into the session's rolling
+    summary once at least SUMMARY_BATCH of them are unsummarized.
+    """
+    if session_id in _summarizing:
+        return
+    _summarizing.add(session_id)
+    try:
+        stats = await asyncio.to_thread(
+            sessions_collection.find_one,
+            {"_id": ObjectId(session_id)},
+            {"summary": 1, "summary_upto": 1, "message_count": 1},
+        )
+        if not stats:
+            return
+
+        start = stats.get("summary_upto", 0)
+        end = stats.get("message_count", 0) - RECENT_WINDOW
+        if end - start < SUMMARY_BATCH:
+            return
+
+        messages = await asyncio.to_thread(fetch_range, session_id, start, end)
+        transcript = "\n".join(
+            f"{m['role']}: {truncate_to_tokens(m.get('content') or '', MAX_MESSAGE_TOKENS)}"
+            for m in messages
+        )
+        with priority(BACKGROUND):
+            result = await model_client.create([
+                SystemMessage(content=SUMMARY_PROMPT),
+                UserMessage(
+                    content=(
+                        f"Existing summary:\n{stats.get('summary') or '(none)'}\n\n"
+                        f"New messages:\n{transcript}"
+                    ),
+                    source="user",
+                ),
+            ])
+        summary = truncate_to_tokens(str(result.content).strip(), SUMMARY_MAX_TOKENS)
+
+        await asyncio.to_thread(
+            sessions_collection.update_one,
+            {"_id": ObjectId(session_id), "summary_upto": stats.get("summary_upto")},
+            {"$set": {"summary": summary, "summary_upto": end}},
+        )
+    except Exception:
+        logger.exception("Failed to update session summary for %s", session_id)
+    finally:
+        _summarizing.discard(session_id)
@@ -0,0 +1,140 @@
+"""
+Where per-session agent state and per-user data versions live.
+
+STATE_STORE=local (default) keeps both in the process: cached agents are
+authoritative and only one worker may serve traffic. STATE_STORE=mongo keeps
+them in MongoDB so any worker can serve any session:
+
+- agent state is saved after every turn via the agent's ``save_state`` and
+  restored with ``load_state``; a version number lets a worker notice that
+  its cached agent is stale
+- the response/semantic cache versions are read from Mongo, so a write on
+  one worker invalidates cached replies on all of them
+
+Data versions are bumped in Mongo in either mode (written behind, like the
+writes they count), so processes that don't share this one's caches (the
+precompute job) can tell when data changed.
+"""
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from agent_cache import agent_cache
+from db import agent_states_collection, data_versions_collection
+from write_behind import write_behind
+
+logger = logging.getLogger(__name__)
+
+STATE_STORE = os.getenv("STATE_STORE", "local")
+SHARED = STATE_STORE == "mongo"
+
+
+class LocalAgentStateStore:
+    """In-process mode: nothing is stored, cached agents are always current."""
+
+    def version(self, session_id: str) -> Optional[int]:
+        return None
+
+    def load(self, session_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+        return None, None
+
+    def save(self, session_id: str, state: Dict[str, Any], expected: Optional[int]) -> Optional[int]:
+        return None
+
+    def delete(self, session_id: str) -> None:
+        pass
+
+
+class MongoAgentStateStore:
+    """
+    Agent state documents keyed by session id with an optimistic version.
+
+    ``save`` only succeeds if the stored version is still the one the agent
+    was loaded at; otherwise another worker ran a newer turn and this
+    agent's state is dropped.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def version(self, session_id: str) -> Optional[int]:
+        doc = self.collection.find_one({"_id": session_id}, {"version": 1})
+        return doc["version"] if doc else None
+
+    def load(self, session_id: str) -> Tuple[Optional[Dict[str, Any]], Optional[int]]:
+        doc = self.collection.find_one({"_id": session_id}, {"state": 1, "version": 1})
+        if not doc:
+            return None, None
+        return doc["state"], doc["version"]
+
+    def save(self, session_id: str, state: Dict[str, Any], expected: Optional[int]) -> Optional[int]:
+        now = datetime.now(timezone.utc)
+        if expected is None:
+            try:
+                self.collection.insert_one(
+                    {"_id": session_id, "state": state, "version": 1, "updated_at": now}
+                )
+                return 1
+            except DuplicateKeyError:
+                return self._conflict(session_id)
+        doc = self.collection.find_one_and_update(
+            {"_id": session_id, "version": expected},
+            {"$set": {"state": state, "updated_at": now}, "$inc": {"version": 1}},
+            projection={"version": 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            return self._conflict(session_id)
+        return doc["version"]
+
+    def _conflict(self, session_id: str) -> None:
+        logger.warning("Agent state for session %s changed on another worker", session_id)
+        return None
+
+    def delete(self, session_id: str) -> None:
+        self.collection.delete_one({"_id": session_id})
+
+
+class MongoDataVersions:
+    """
+    Per-user counters of wardrobe/recent/feedback writes, kept in Mongo.
+
+    Bumps are queued on the write-behind queue behind the writes they
+    count; ``get`` waits for the user's queued writes first.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get(self, username: str) -> Dict[str, int]:
+        write_behind.flush_user(username)
+        return self.collection.find_one({"_id": username}, {"_id": 0}) or {}
+
+    def get_many(self, usernames) -> Dict[str, Dict[str, int]]:
+        found = {
+            doc.pop("_id"): doc
+            for doc in self.collection.find({"_id": {"$in": list(usernames)}})
+        }
+        return {username: found.get(username, {}) for username in usernames}
+
+    def bump(self, username: str, kind: str) -> None:
+        write_behind.update(
+            self.collection.name, {"_id": username}, {"$inc": {kind: 1}}, upsert=True
+        )
+
+
+data_versions = MongoDataVersions(data_versions_collection)
+if SHARED:
+    agent_states = MongoAgentStateStore(agent_states_collection)
+else:
+    agent_states = LocalAgentStateStore()
+
+
+def forget_agent(session_id: str) -> None:
+    """Drop the session's agent everywhere; the next turn rebuilds it from history."""
+    agent_cache.pop(session_id)
+    agent_states.delete(session_id)
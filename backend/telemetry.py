@@ -0,0 +1,306 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_BUCKETS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) without a tokenizer."""
+    return len(text or "") // 4 + 1
+
+
+class Trace:
+    """Spans recorded while serving one request, in start order."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans: List[tuple] = []  # (name, offset, duration, attrs)
+
+    def add(self, name: str, start: float, duration: float, **attrs) -> None:
+        self.spans.append((name, start - self.start, duration, attrs))
+
+    def format(self) -> str:
+        total = time.perf_counter() - self.start
+        lines = [f"{self.name} {total * 1000:.1f}ms"]
+        for name, offset, duration, attrs in self.spans:
+            extra = " ".join(f"{key}={value}" for key, value in attrs.items())
+            lines.append(
+                f"  +{offset * 1000:7.1f}ms {duration * 1000:8.1f}ms  {name} {extra}".rstrip()
+            )
+        return "\n".join(lines)
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple, buckets: tuple = DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values) -> None:
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                labels = _labels(zip(self.labels, values))
+                for bound, count in zip(self.buckets, series):
+                    lines.append(
+                        f'{self.name}_bucket{_labels(zip(self.labels, values), le=bound)} {count}'
+                    )
+                lines.append(
+                    f'{self.name}_bucket{_labels(zip(self.labels, values), le="+Inf")} {series[-1]}'
+                )
+                lines.append(f"{self.name}_sum{labels} {series[-2]}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+    def totals(self) -> Dict[tuple, dict]:
+        """Sum and count per label values."""
+        with self._lock:
+            return {
+                values: {"sum": series[-2], "count": series[-1]}
+                for values, series in self._series.items()
+            }
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(zip(self.labels, values))} {value}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs, **extra) -> str:
+    items = [*pairs, *extra.items()]
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+http_requests = Histogram(
+    "outfit_http_request_duration_seconds", "HTTP request latency",
+    ("method", "endpoint", "status"),
+)
+span_durations = Histogram(
+    "outfit_span_duration_seconds", "Duration of traced stages of a chat turn", ("span",)
+)
+tool_durations = Histogram(
+    "outfit_tool_duration_seconds", "FunctionTool execution time", ("tool",)
+)
+tool_errors = Counter("outfit_tool_errors_total", "FunctionTool calls that raised", ("tool",))
+tool_output_tokens = Histogram(
+    "outfit_tool_output_tokens", "Estimated tokens in FunctionTool results", ("tool",),
+    buckets=TOKEN_BUCKETS,
+)
+mongo_durations = Histogram(
+    "outfit_mongo_command_duration_seconds", "MongoDB command latency",
+    ("command", "collection"),
+)
+mongo_failures = Counter(
+    "outfit_mongo_command_failures_total", "MongoDB commands that failed",
+    ("command", "collection"),
+)
+
+
+@contextmanager
+def trace(name: str):
+    """Collect spans for one request; yields the Trace."""
+    request_trace = Trace(name)
+    token = current_trace.set(request_trace)
+    try:
+        yield request_trace
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, histogram: Histogram = span_durations, label: str = None, **attrs):
+    """
+    Time the block into ``histogram`` and the current request's trace.
+    Yields the span's attributes; keys added inside the block are recorded too.
+    """
+    start = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        duration = time.perf_counter() - start
+        histogram.observe(duration, label or name)
+        request_trace = current_trace.get()
+        if request_trace is not None:
+            request_trace.add(name, start, duration, **attrs)
+
+
+def timed_tool(name: str, func: Callable) -> Callable:
+    """
+    Wrap a sync tool function for FunctionTool so each call is timed and
+    the size of its result (what the model has to read) is counted.
+
+    The wrapper is async and runs ``func`` via ``asyncio.to_thread`` so the
+    request's trace context reaches the worker thread (and its Mongo spans).
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with span(f"tool.{name}", tool_durations, name) as attrs:
+            try:
+                result = await asyncio.to_thread(func, *args, **kwargs)
+            except Exception:
+                tool_errors.inc(name)
+                raise
+            tokens = estimate_tokens(str(result))
+            tool_output_tokens.observe(tokens, name)
+            attrs["output_tokens"] = tokens
+            return result
+
+    return wrapper
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Feeds PyMongo command timings into the metrics and the current trace."""
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else ""
+        )
+
+    def _finish(self, event, failed: bool) -> None:
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        duration = event.duration_micros / 1e6
+        mongo_durations.observe(duration, event.command_name, collection)
+        if failed:
+            mongo_failures.inc(event.command_name, collection)
+        request_trace = current_trace.get()
+        if request_trace is not None:
+            request_trace.add(
+                f"mongo.{event.command_name}", time.perf_counter() - duration, duration,
+                collection=collection,
+            )
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+
+mongo_listener = MongoCommandListener()
+
+# Component stats() callables shown on /metrics, registered as modules load
+stats_providers: Dict[str, Callable[[], dict]] = {}
+
+# Boot timings filled in by the app factory
+startup: Dict[str, float] = {}
+
+
+def register_stats(prefix: str, provider: Callable[[], dict]) -> None:
+    stats_providers[prefix] = provider
+
+# Stats keys that only ever grow; rendered as counters, everything else as gauges
+COUNTER_KEYS = {
+    "hits", "misses", "evictions", "expirations", "upstream_calls", "calls",
+    "errors", "retries", "prompt_tokens", "completion_tokens", "enqueued",
+    "written", "backpressure_waits", "failures", "hashes", "verifications", "rehashes",
+    "rejected", "timeouts", "hash_seconds", "wait_seconds", "stale",
+}
+
+
+def render_stats(prefix: str, stats: dict) -> List[str]:
+    """Render a component's flat ``stats()`` dict as Prometheus samples."""
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        if key in COUNTER_KEYS:
+            name = f"outfit_{prefix}_{key}_total"
+            lines += [f"# TYPE {name} counter", f"{name} {value}"]
+        else:
+            name = f"outfit_{prefix}_{key}"
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return lines
+
+
+def render_model_stats(stats: dict) -> List[str]:
+    """Model gateway stats, with its latency buckets as a cumulative histogram."""
+    buckets = stats.get("latency_buckets", {})
+    lines = render_stats("model", {
+        key: value for key, value in stats.items() if key not in ("latency_buckets", "latency_sum")
+    })
+    name = "outfit_model_latency_seconds"
+    lines += [f"# HELP {name} Model call latency", f"# TYPE {name} histogram"]
+    cumulative = 0
+    for bound, count in buckets.items():
+        cumulative += count
+        lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+    lines.append(f"{name}_sum {stats.get('latency_sum', 0.0)}")
+    lines.append(f"{name}_count {cumulative}")
+    return lines
+
+
+def render_metrics() -> str:
+    """
+    Prometheus text exposition of the request/span/tool/Mongo metrics, the
+    startup timings and the ``stats()`` of each registered component.
+    """
+    lines = []
+    for metric in (http_requests, span_durations, tool_durations, tool_errors,
+                   tool_output_tokens, mongo_durations, mongo_failures):
+        lines += metric.render()
+    lines += render_stats("startup", startup)
+    for prefix, stats in list(stats_providers.items()):
+        try:
+            snapshot = stats()
+        except Exception:
+            logger.exception("Failed to collect %s stats", prefix)
+            continue
+        if prefix == "model":
+            lines += render_model_stats(snapshot)
+        else:
+            lines += render_stats(prefix, snapshot)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import mongomock
+import pymongo
+import pytest
+
+# Must happen before db.py creates its client
+pymongo.MongoClient = mongomock.MongoClient
+os.environ.setdefault("OPENAI_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def clean_db():
+    from db import client, MONGO_DB
+    client.drop_database(MONGO_DB)
+    yield
+    client.drop_database(MONGO_DB)
@@ -0,0 +1,60 @@
+import asyncio
+import concurrent.futures
+
+import pytest
+
+import assistant
+from agent_cache import agent_cache
+from event_loop import run_async, iterate_async
+
+
+class SlowAgent:
+    async def run(self, task):
+        await asyncio.sleep(10)
+
+    async def run_stream(self, task):
+        yield assistant.ModelClientStreamingChunkEvent(content="Hel", source="assistant")
+        await asyncio.sleep(10)
+
+
+@pytest.fixture
+def cached_agent(monkeypatch):
+    session_id = "0123456789abcdef01234567"
+    agent = SlowAgent()
+
+    async def prepare_turn(session_id, username, task, location=None):
+        return agent, None, task
+
+    monkeypatch.setattr(assistant, "prepare_turn", prepare_turn)
+    agent_cache.put(session_id, (agent, None))
+    yield session_id
+    agent_cache.pop(session_id)
+
+
+def _wait_until_forgotten(session_id):
+    for _ in range(100):
+        if agent_cache.get(session_id) is None:
+            return True
+        run_async(asyncio.sleep(0.01))
+    return False
+
+
+def test_timed_out_turn_drops_the_cached_agent(cached_agent):
+    with pytest.raises(concurrent.futures.TimeoutError):
+        run_async(assistant.run_turn(cached_agent, "alice", "hi"), timeout=0.05)
+    assert _wait_until_forgotten(cached_agent)
+
+
+def test_abandoned_stream_drops_the_cached_agent(cached_agent):
+    events = iterate_async(assistant.stream_turn(cached_agent, "alice", "hi"))
+    assert next(events) == ("token", {"content": "Hel"})
+    events.close()  # client disconnected
+    assert _wait_until_forgotten(cached_agent)
+
+
+def test_stalled_stream_times_out_and_drops_the_cached_agent(cached_agent):
+    events = iterate_async(assistant.stream_turn(cached_agent, "alice", "hi"), timeout=0.2)
+    assert next(events) == ("token", {"content": "Hel"})
+    with pytest.raises(concurrent.futures.TimeoutError):
+        next(events)
+    assert _wait_until_forgotten(cached_agent)
@@ -0,0 +1,23 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from passwords import PasswordHasher, canonical_method
+
+
+@pytest.mark.parametrize("method", ["scrypt", "pbkdf2:sha256", "pbkdf2:sha256:1000"])
+def test_hashes_made_with_the_configured_method_are_current(method):
+    hasher = PasswordHasher(method=method, workers=0)
+    assert not hasher.needs_rehash(hasher.hash("secret"))
+
+
+def test_hashes_made_with_other_parameters_need_a_rehash():
+    hasher = PasswordHasher(method="scrypt", workers=0)
+    assert hasher.needs_rehash(generate_password_hash("secret", method="pbkdf2:sha256:1000"))
+
+
+@pytest.mark.parametrize("method", [
+    "scrypt", "scrypt:16384:8:1", "pbkdf2", "pbkdf2:sha512", "pbkdf2:sha256:1000",
+])
+def test_canonical_method_matches_werkzeug(method):
+    stored = generate_password_hash("secret", method=method).split("$", 1)[0]
+    assert canonical_method(method) == stored
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import requests
+
+import precompute
+from db import users_collection, precomputed_collection, wardrobe_items_collection
+from recommender import bulk_load_wardrobes, load_wardrobe
+from wardrobe_index import normalize_item
+
+LOCATION = {"latitude": 9.03, "longitude": 38.74}
+WEATHER = {"description": "clear sky", "feels_like": 24.0}
+
+
+@pytest.fixture
+def users(monkeypatch):
+    now = datetime.now(timezone.utc)
+    for username in ("alice", "bob"):
+        users_collection.insert_one(
+            {"username": username, "last_seen": now, "last_location": LOCATION}
+        )
+        for position, (type_, color) in enumerate([("t-shirt", "white"), ("jeans", "blue")]):
+            wardrobe_items_collection.insert_one({
+                **normalize_item({"type": type_, "color": color}),
+                "username": username,
+                "position": position,
+                "timestamp": now,
+            })
+    monkeypatch.setattr(precompute.weather_service, "get", lambda lat, lon: WEATHER)
+    return ["alice", "bob"]
+
+
+def test_bulk_wardrobes_match_per_user_loads(users):
+    assert bulk_load_wardrobes(users + ["carol"]) == {
+        "alice": load_wardrobe("alice"), "bob": load_wardrobe("bob"), "carol": [],
+    }
+
+
+def test_batch_stores_picks_that_lookup_serves(users):
+    assert precompute.run_batch()["stored"] == 2
+    reply = precompute.precomputed.lookup("alice", LOCATION)
+    assert "t-shirt" in reply and "clear sky" in reply
+
+
+def test_no_picks_without_weather(users, monkeypatch):
+    def down(lat, lon):
+        raise requests.ConnectionError("weather down")
+
+    monkeypatch.setattr(precompute.weather_service, "get", down)
+    assert precompute.run_batch()["stored"] == 0
+    assert precomputed_collection.count_documents({}) == 0
+
+
+def test_yesterdays_pick_is_stale(users):
+    precompute.run_batch(datetime.now(timezone.utc) - timedelta(days=1))
+    precomputed_collection.update_many(
+        {}, {"$set": {"expires_at": datetime.now(timezone.utc) + timedelta(hours=1)}}
+    )
+    assert precompute.precomputed.lookup("alice", LOCATION) is None
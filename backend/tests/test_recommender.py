@@ -0,0 +1,20 @@
+from recommender import SLOT_WIDTH, score_candidates
+from wardrobe_index import normalize_item
+
+
+def _items(*pieces):
+    return [normalize_item({"type": t, "color": c}) for t, c in pieces]
+
+
+def test_cold_weather_picks_warm_top_beyond_the_slot_width():
+    tops = [("t-shirt", color) for color in ("white", "black", "grey", "navy", "beige",
+                                            "red", "green", "blue", "brown", "olive")]
+    assert len(tops) > SLOT_WIDTH
+    items = _items(*tops, ("sweater", "cream"), ("jeans", "blue"), ("coat", "camel"))
+    # Tops the user likes rank ahead of the sweater before weather is considered
+    preference = {(item["type"], item["color"]): 1.0 for item in items[:len(tops)]}
+
+    ranked = score_candidates(items, feels_like=-10, recency={}, preference=preference)
+
+    best = {piece["type"] for piece in ranked[0][1]}
+    assert "sweater" in best
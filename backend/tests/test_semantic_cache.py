@@ -0,0 +1,36 @@
+import pytest
+
+from semantic_cache import SemanticCache
+
+STATE = (1, 0, 0, None, "2026-10-18")
+QUESTION = "Suggest an outfit with a jacket"
+
+
+@pytest.fixture
+def cache():
+    cache = SemanticCache()
+    cache.put("alice", QUESTION, STATE, "cached reply")
+    return cache
+
+
+@pytest.mark.parametrize("message", [
+    "suggest an outfit with a jacket please",
+    "What outfit with a jacket would you suggest?",
+])
+def test_rephrased_question_hits(cache, message):
+    assert cache.get("alice", message, STATE) == "cached reply"
+
+
+@pytest.mark.parametrize("message", [
+    "Suggest an outfit without a jacket",
+    "Suggest an outfit with no jacket",
+    "Suggest an outfit with a jacket for a funeral",
+    "Suggest an outfit",
+])
+def test_negated_or_qualified_question_misses(cache, message):
+    assert cache.get("alice", message, STATE) is None
+
+
+def test_other_state_or_user_misses(cache):
+    assert cache.get("alice", QUESTION, (2, 0, 0, None, "2026-10-18")) is None
+    assert cache.get("bob", QUESTION, STATE) is None
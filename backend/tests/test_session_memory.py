@@ -0,0 +1,57 @@
+import asyncio
+
+from autogen_core.models import (
+    AssistantMessage,
+    FunctionExecutionResultMessage,
+    FunctionExecutionResult,
+    SystemMessage,
+    UserMessage,
+)
+
+from db import sessions_collection
+from session_memory import BoundedChatCompletionContext, SessionHistoryMemory
+
+
+def _user(text):
+    return UserMessage(content=text, source="user")
+
+
+def _reply(text):
+    return AssistantMessage(content=text, source="assistant")
+
+
+def test_earlier_turns_are_kept_within_the_token_budget():
+    context = BoundedChatCompletionContext(buffer_size=20, token_budget=100)
+
+    async def run():
+        await context.add_message(_user("old question"))
+        await context.add_message(FunctionExecutionResultMessage(content=[
+            FunctionExecutionResult(content="x" * 2000, call_id="1", name="tool"),
+        ]))
+        await context.add_message(_reply("old answer"))
+        await context.add_message(_user("new question " + "y" * 1000))
+        return await context.get_messages()
+
+    messages = asyncio.run(run())
+    # The current turn stays whole even above the budget; the large tool
+    # result and everything before it are left out
+    assert [m.content for m in messages] == ["old answer", "new question " + "y" * 1000]
+
+
+def test_current_summary_is_injected_on_every_turn():
+    session_id = sessions_collection.insert_one({"summary": "likes navy"}).inserted_id
+    memory = SessionHistoryMemory(str(session_id), [])
+    context = BoundedChatCompletionContext(buffer_size=20)
+
+    async def turn(text):
+        await context.add_message(_user(text))
+        await memory.update_context(context)
+        return await context.get_messages()
+
+    first = asyncio.run(turn("hi"))
+    sessions_collection.update_one({"_id": session_id}, {"$set": {"summary": "likes grey"}})
+    second = asyncio.run(turn("again"))
+
+    assert isinstance(first[0], SystemMessage) and "likes navy" in first[0].content
+    assert isinstance(second[0], SystemMessage) and "likes grey" in second[0].content
+    assert sum(isinstance(m, SystemMessage) for m in second) == 1
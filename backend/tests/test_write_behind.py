@@ -0,0 +1,163 @@
+import threading
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+import write_behind as wb
+from db import db, sessions_collection, messages_collection
+from write_behind import Journal, WriteBehindQueue
+
+
+def _session(message_count=0):
+    return sessions_collection.insert_one(
+        {"user_id": "alice", "message_count": message_count}
+    ).inserted_id
+
+
+def _messages(session_id):
+    return [
+        (doc["seq"], doc["content"])
+        for doc in messages_collection.find({"session_id": session_id}).sort("seq", 1)
+    ]
+
+
+@pytest.fixture
+def queue():
+    queues = []
+
+    def make(**kwargs):
+        q = WriteBehindQueue(enabled=True, flush_interval=0.01, **kwargs)
+        queues.append(q)
+        return q
+
+    yield make
+    for q in queues:
+        q.stop()
+
+
+def test_replay_skips_writes_that_already_landed(tmp_path, queue):
+    session_id = _session()
+    path = str(tmp_path / "journal")
+    crashed = WriteBehindQueue(enabled=True, journal=Journal(path))
+    crashed.journal.open()
+    crashed._thread = object()  # queue without a worker, like a process about to die
+    crashed.insert("user_outfits", {"username": "alice", "outfit": []})
+    crashed.append_messages(str(session_id), [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "hello"},
+    ])
+    # The worker wrote the batch but died before committing the journal
+    ops = [op for _, op in list(crashed._queue.queue)]
+    crashed._apply(ops)
+
+    restarted = queue(journal=Journal(path))
+    restarted.start()
+    assert restarted.flush(5)
+
+    assert db["user_outfits"].count_documents({"username": "alice"}) == 1
+    assert _messages(session_id) == [(0, "hi"), (1, "hello")]
+
+
+def test_start_with_database_down_replays_on_the_worker(tmp_path, monkeypatch, queue):
+    path = str(tmp_path / "journal")
+    crashed = WriteBehindQueue(enabled=True, journal=Journal(path))
+    crashed.journal.open()
+    crashed._thread = object()
+    crashed.insert("user_outfits", {"username": "alice", "outfit": []})
+
+    def down(*args, **kwargs):
+        raise AutoReconnect("connection refused")
+
+    monkeypatch.setattr(db["user_outfits"].__class__, "bulk_write", down)
+    monkeypatch.setattr(wb.time, "sleep", lambda seconds: None)
+    restarted = queue(journal=Journal(path))
+    restarted.start()  # must not raise
+    assert restarted.flush(5)
+
+    assert restarted.failures == 1
+    with open(restarted.journal.failed_path, encoding="utf-8") as f:
+        assert "alice" in f.read()
+
+
+def test_retry_applies_only_the_unwritten_part(monkeypatch, queue):
+    session_id = _session()
+    insert_many = messages_collection.insert_many
+    calls = []
+
+    def flaky(docs, **kwargs):
+        calls.append(docs)
+        if len(calls) == 1:
+            raise AutoReconnect("connection reset")
+        return insert_many(docs, **kwargs)
+
+    monkeypatch.setattr(messages_collection, "insert_many", flaky)
+    monkeypatch.setattr(wb.time, "sleep", lambda seconds: None)
+    q = queue()
+    q._apply = _gated(q, threading.Event())  # hold the worker until both ops are queued
+    q.start()
+    q.update("user_preferences", {"username": "alice"}, {"$inc": {"likes": 1}}, upsert=True)
+    q.append_messages(str(session_id), [{"role": "user", "content": "hi"}])
+    q._apply.gate.set()
+    assert q.flush(5)
+
+    assert db["user_preferences"].find_one({"username": "alice"})["likes"] == 1
+    assert [content for _, content in _messages(session_id)] == ["hi"]
+    assert len(calls) == 2
+    assert q.failures == 0
+
+
+def test_failed_batch_is_dead_lettered(tmp_path, monkeypatch, queue):
+    def down(*args, **kwargs):
+        raise AutoReconnect("connection refused")
+
+    monkeypatch.setattr(db["user_outfits"].__class__, "bulk_write", down)
+    monkeypatch.setattr(wb.time, "sleep", lambda seconds: None)
+    q = queue(journal=Journal(str(tmp_path / "journal")))
+    q.start()
+    q.insert("user_outfits", {"username": "alice", "outfit": []})
+    assert q.flush(5)
+
+    assert q.failures == 1
+    with open(q.journal.failed_path, encoding="utf-8") as f:
+        assert "alice" in f.read()
+
+
+def test_backpressure_keeps_appends_behind_their_session(monkeypatch, queue):
+    monkeypatch.setattr(wb, "ENQUEUE_TIMEOUT", 0.01)
+    q = queue(max_size=1, batch_size=1)
+    q._apply = _gated(q, threading.Event())
+    q.start()
+    session_id = q.insert("chat_sessions", {"user_id": "alice", "message_count": 0})
+    # The worker holds the session insert; the first append fills the queue
+    # and the second has to wait for room
+    q.append_messages(str(session_id), [{"role": "user", "content": "one"}])
+    threading.Timer(0.1, q._apply.gate.set).start()
+    q.append_messages(str(session_id), [{"role": "user", "content": "two"}])
+    assert q.flush(5)
+
+    assert q.backpressure_waits == 1
+    assert _messages(session_id) == [(0, "one"), (1, "two")]
+
+
+def test_flush_user_waits_only_for_that_users_writes(queue):
+    q = queue()
+    q._apply = _gated(q, threading.Event())
+    q.start()
+    q.insert("user_outfits", {"username": "alice", "outfit": []})
+
+    assert q.flush_user("bob", 0.05)
+    assert not q.flush_user("alice", 0.05)
+    q._apply.gate.set()
+    assert q.flush_user("alice", 5)
+    assert db["user_outfits"].count_documents({"username": "alice"}) == 1
+
+
+def _gated(q, gate):
+    apply = q._apply
+
+    def gated(*args, **kwargs):
+        gate.wait()
+        return apply(*args, **kwargs)
+
+    gated.gate = gate
+    return gated
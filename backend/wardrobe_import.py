@@ -0,0 +1,226 @@
+"""
+Bulk wardrobe import from streamed NDJSON or CSV uploads.
+
+Each row is one garment: ``type`` (required), ``color``, ``style`` and an
+optional ``outfit`` label. Consecutive rows with the same label are stored as
+one outfit; rows without one become single-item outfits. Rows are validated
+and written in chunks with unordered ``insert_many`` so memory stays bounded
+however large the upload is.
+"""
+import codecs
+import csv
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from db import outfit_collection, wardrobe_items_collection
+from response_cache import invalidate, WARDROBE
+from wardrobe_index import item_rows
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv("WARDROBE_IMPORT_CHUNK_SIZE", "500"))
+MAX_ROWS = int(os.getenv("WARDROBE_IMPORT_MAX_ROWS", "5000"))
+MAX_REPORTED_ERRORS = 100
+MAX_FIELD_LENGTH = 64
+MAX_LINE_BYTES = 4096
+FIELDS = ("type", "color", "style")
+
+Row = Tuple[int, Optional[dict], Optional[str]]  # (row number, item, error)
+
+
+def _text_lines(stream) -> Iterator[str]:
+    """Decode a binary stream into lines, holding at most one read buffer."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    while True:
+        chunk = stream.read(64 * 1024)
+        if not chunk:
+            break
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line[:MAX_LINE_BYTES]
+        if len(pending) > MAX_LINE_BYTES:
+            # Overlong line: keep only what we would have kept anyway
+            pending = pending[:MAX_LINE_BYTES]
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending[:MAX_LINE_BYTES]
+
+
+def parse_ndjson(stream) -> Iterator[Row]:
+    for number, line in enumerate(_text_lines(stream), start=1):
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError:
+            yield number, None, "invalid JSON"
+            continue
+        if not isinstance(value, dict):
+            yield number, None, "expected a JSON object"
+            continue
+        yield number, value, None
+
+
+def parse_csv(stream) -> Iterator[Row]:
+    reader = csv.DictReader(_text_lines(stream))
+    if reader.fieldnames is None:
+        return
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    if "type" not in reader.fieldnames:
+        yield 1, None, "header must include a 'type' column"
+        return
+    for row in reader:
+        # Header is row 1
+        yield reader.line_num, {k: v for k, v in row.items() if k}, None
+
+
+def validate(item: dict) -> Tuple[Optional[dict], Optional[str]]:
+    """Return the cleaned garment (plus outfit label) or an error message."""
+    piece = {}
+    for field in FIELDS:
+        value = item.get(field)
+        if value is None or value == "":
+            continue
+        if not isinstance(value, str):
+            return None, f"'{field}' must be a string"
+        value = value.strip()
+        if len(value) > MAX_FIELD_LENGTH:
+            return None, f"'{field}' is longer than {MAX_FIELD_LENGTH} characters"
+        if value:
+            piece[field] = value
+    if "type" not in piece:
+        return None, "missing 'type'"
+    label = item.get("outfit")
+    if label is not None and not isinstance(label, (str, int)):
+        return None, "'outfit' must be a string"
+    return {"piece": piece, "outfit": str(label).strip() if label not in (None, "") else None}, None
+
+
+def _group(items: List[Tuple[int, dict]]) -> List[Tuple[List[int], List[dict]]]:
+    """Group consecutive items sharing an outfit label."""
+    groups = []
+    last_label = None
+    for number, item in items:
+        label = item["outfit"]
+        if label is not None and label == last_label:
+            groups[-1][0].append(number)
+            groups[-1][1].append(item["piece"])
+        else:
+            groups.append(([number], [item["piece"]]))
+        last_label = label
+    return groups
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.outfits = 0
+        self.error_count = 0
+        self.errors: List[dict] = []
+
+    def error(self, row: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"row": row, "error": message})
+
+    def progress(self) -> dict:
+        return {
+            "event": "progress",
+            "rows": self.rows,
+            "imported": self.imported,
+            "outfits": self.outfits,
+            "errors": self.error_count,
+        }
+
+    def done(self) -> dict:
+        return {**self.progress(), "event": "done", "error_details": self.errors}
+
+
+def _write_chunk(username: str, items: List[Tuple[int, dict]], report: ImportReport) -> None:
+    now = datetime.now(timezone.utc)
+    groups = _group(items)
+    docs = [
+        {"_id": ObjectId(), "username": username, "outfit": pieces, "timestamp": now}
+        for _, pieces in groups
+    ]
+
+    failed = set()
+    try:
+        outfit_collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            failed.add(error["index"])
+            for number in groups[error["index"]][0]:
+                report.error(number, error.get("errmsg", "write failed"))
+    except PyMongoError as e:
+        for numbers, _ in groups:
+            for number in numbers:
+                report.error(number, f"database error: {e}")
+        return
+
+    stored = [doc for index, doc in enumerate(docs) if index not in failed]
+    rows = [row for doc in stored for row in item_rows(username, doc)]
+    if rows:
+        try:
+            wardrobe_items_collection.insert_many(rows, ordered=False)
+        except PyMongoError as e:
+            # The outfits are saved; `python wardrobe_index.py <user>` rebuilds the index
+            logger.warning("Failed to index imported items for %s: %s", username, e)
+    report.outfits += len(stored)
+    report.imported += sum(len(doc["outfit"]) for doc in stored)
+
+
+def import_rows(username: str, rows: Iterable[Row], max_rows: int = MAX_ROWS) -> Iterator[dict]:
+    """
+    Validate and store parsed rows chunk by chunk.
+
+    Yields:
+    - a "progress" dict after every chunk and a final "done" dict with
+      per-row errors (the first MAX_REPORTED_ERRORS of them)
+    """
+    report = ImportReport()
+    chunk: List[Tuple[int, dict]] = []
+    try:
+        for number, item, error in rows:
+            if report.rows >= max_rows:
+                report.error(number, f"upload exceeds {max_rows} rows; the rest was skipped")
+                break
+            report.rows += 1
+            if error is None:
+                item, error = validate(item)
+            if error is not None:
+                report.error(number, error)
+                continue
+            # Flush full chunks, but don't split a labelled outfit across them
+            if len(chunk) >= CHUNK_SIZE and (
+                item["outfit"] is None
+                or item["outfit"] != chunk[-1][1]["outfit"]
+                or len(chunk) >= 2 * CHUNK_SIZE
+            ):
+                _write_chunk(username, chunk, report)
+                chunk = []
+                yield report.progress()
+            chunk.append((number, item))
+        if chunk:
+            _write_chunk(username, chunk, report)
+            yield report.progress()
+    finally:
+        if report.imported:
+            invalidate(username, WARDROBE)
+    yield report.done()
+
+
+def parse_upload(stream, content_type: str) -> Iterator[Row]:
+    """Pick the parser from the upload's content type (NDJSON by default)."""
+    if "csv" in (content_type or "").lower():
+        return parse_csv(stream)
+    return parse_ndjson(stream)
@@ -0,0 +1,164 @@
+"""
+Item-level index of user wardrobes.
+
+Each garment in a ``user_outfits`` document gets one row in ``wardrobe_items``
+with normalized attributes (category, color family, warmth) so tools can
+query a handful of matching items instead of dumping the whole wardrobe.
+
+Run ``python wardrobe_index.py [username]`` to rebuild the index from
+existing outfits.
+"""
+import sys
+from typing import Dict, List, Optional
+
+from db import outfit_collection, wardrobe_items_collection, ensure_indexes
+from write_behind import write_behind
+
+CATEGORIES = {
+    "outerwear": (
+        "jacket", "coat", "parka", "blazer", "puffer", "windbreaker", "raincoat",
+        "trench", "overcoat", "vest", "gilet", "cardigan",
+    ),
+    "top": (
+        "t-shirt", "tshirt", "tee", "shirt", "blouse", "top", "sweater", "hoodie",
+        "sweatshirt", "jumper", "polo", "tank", "turtleneck", "pullover",
+    ),
+    "bottom": (
+        "jeans", "pants", "trousers", "shorts", "skirt", "chinos", "joggers",
+        "leggings", "sweatpants", "cargo",
+    ),
+    "dress": ("dress", "gown", "jumpsuit", "romper", "suit"),
+    "footwear": (
+        "shoes", "shoe", "sneakers", "trainers", "boots", "boot", "sandals",
+        "heels", "loafers", "flats", "slippers",
+    ),
+    "accessory": (
+        "hat", "cap", "beanie", "scarf", "gloves", "belt", "bag", "watch",
+        "sunglasses", "tie",
+    ),
+}
+
+COLOR_FAMILIES = {
+    "neutral": ("black", "white", "grey", "gray", "charcoal", "silver", "cream", "ivory", "off-white"),
+    "earth": ("brown", "beige", "tan", "khaki", "camel", "olive", "taupe", "rust"),
+    "blue": ("blue", "navy", "denim", "teal", "turquoise", "sky", "indigo", "cyan"),
+    "red": ("red", "maroon", "burgundy", "wine", "crimson", "scarlet"),
+    "pink": ("pink", "rose", "magenta", "fuchsia", "blush"),
+    "green": ("green", "mint", "emerald", "lime", "sage", "forest"),
+    "yellow": ("yellow", "mustard", "gold", "lemon"),
+    "orange": ("orange", "coral", "peach"),
+    "purple": ("purple", "violet", "lavender", "lilac", "plum"),
+}
+
+# 1 = very light, 5 = very warm
+WARMTH_BY_TYPE = {
+    "tank": 1, "shorts": 1, "sandals": 1, "skirt": 2, "t-shirt": 2, "tshirt": 2,
+    "tee": 2, "polo": 2, "blouse": 2, "shirt": 2, "dress": 2, "sneakers": 2,
+    "jeans": 3, "pants": 3, "trousers": 3, "chinos": 3, "joggers": 3,
+    "cardigan": 3, "blazer": 3, "windbreaker": 3, "boots": 3,
+    "sweater": 4, "hoodie": 4, "sweatshirt": 4, "jumper": 4, "turtleneck": 4,
+    "jacket": 4, "raincoat": 3, "scarf": 4, "gloves": 4, "beanie": 4,
+    "coat": 5, "parka": 5, "puffer": 5, "overcoat": 5,
+}
+WARMTH_BY_CATEGORY = {
+    "outerwear": 4, "top": 2, "bottom": 3, "dress": 2, "footwear": 2, "accessory": 2, "other": 2,
+}
+WARM_STYLES = ("fur", "wool", "fleece", "down", "knit", "thermal", "leather", "padded")
+LIGHT_STYLES = ("linen", "mesh", "sleeveless", "short-sleeve", "cropped", "silk")
+
+
+def _words(value: Optional[str]) -> List[str]:
+    return (value or "").lower().replace("_", " ").split()
+
+
+def _lookup(words: List[str], table: Dict[str, tuple], default: str) -> str:
+    for word in words:
+        for key, names in table.items():
+            if word in names or word.rstrip("s") in names:
+                return key
+    return default
+
+
+def normalize_item(piece: dict) -> dict:
+    """Return the normalized, queryable attributes of one garment."""
+    type_ = (piece.get("type") or "item").strip().lower()
+    color = (piece.get("color") or "unknown").strip().lower()
+    style = (piece.get("style") or "").strip().lower()
+
+    type_words = _words(type_) + _words(style)
+    category = _lookup(type_words, CATEGORIES, "other")
+    color_family = _lookup(_words(color), COLOR_FAMILIES, "other")
+
+    warmth = None
+    for word in type_words:
+        warmth = WARMTH_BY_TYPE.get(word) or WARMTH_BY_TYPE.get(word.rstrip("s"))
+        if warmth:
+            break
+    warmth = warmth or WARMTH_BY_CATEGORY[category]
+    style_words = _words(style)
+    if any(w in WARM_STYLES for w in style_words):
+        warmth += 1
+    if any(w in LIGHT_STYLES for w in style_words):
+        warmth -= 1
+
+    return {
+        "type": type_,
+        "color": color,
+        "style": style or None,
+        "category": category,
+        "color_family": color_family,
+        "warmth": max(1, min(5, warmth)),
+    }
+
+
+def item_rows(username: str, outfit_doc: dict) -> List[dict]:
+    rows = []
+    for position, piece in enumerate(outfit_doc.get("outfit", [])):
+        if not isinstance(piece, dict):
+            continue
+        row = normalize_item(piece)
+        row.update({
+            "username": username,
+            "outfit_id": outfit_doc["_id"],
+            "position": position,
+            "timestamp": outfit_doc.get("timestamp"),
+        })
+        rows.append(row)
+    return rows
+
+
+def index_outfit(username: str, outfit_doc: dict) -> int:
+    """Index the garments of one stored outfit document. Returns rows written."""
+    rows = item_rows(username, outfit_doc)
+    write_behind.insert_many(wardrobe_items_collection.name, rows)
+    return len(rows)
+
+
+def rebuild_wardrobe_index(username: Optional[str] = None, batch_size: int = 500) -> int:
+    """
+    Rebuild ``wardrobe_items`` from ``user_outfits`` for one user or everyone.
+
+    Returns:
+    - Number of item rows written
+    """
+    query = {"username": username} if username else {}
+    wardrobe_items_collection.delete_many(query)
+
+    written = 0
+    batch = []
+    for doc in outfit_collection.find(query, {"username": 1, "outfit": 1, "timestamp": 1}):
+        batch.extend(item_rows(doc["username"], doc))
+        if len(batch) >= batch_size:
+            wardrobe_items_collection.insert_many(batch, ordered=False)
+            written += len(batch)
+            batch = []
+    if batch:
+        wardrobe_items_collection.insert_many(batch, ordered=False)
+        written += len(batch)
+    return written
+
+
+if __name__ == "__main__":
+    ensure_indexes()
+    count = rebuild_wardrobe_index(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"✅ Indexed {count} wardrobe item(s).")
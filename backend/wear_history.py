@@ -0,0 +1,127 @@
+"""
+Incrementally maintained per-user wear history.
+
+Every worn-outfit write folds its garments into one ``wear_history``
+document per user, keyed by normalized garment (type and color): when it
+was last worn and its most recent wear times, newest first and capped at
+MAX_WEARS. Each write is a single atomic ``$max``/``$push`` update, so
+recency checks read one small document instead of range-scanning
+``recent_outfits``; wear counts over sliding windows are taken from the
+stored times at read time.
+
+Run ``python wear_history.py [username]`` to rebuild the history from
+existing ``recent_outfits``.
+"""
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from db import recent_outfits_collection, wear_history_collection, ensure_indexes
+from preferences import garment_attribute
+from wardrobe_index import normalize_item
+from write_behind import write_behind
+
+MAX_WEARS = 32  # wear times kept per garment
+WINDOWS = (7, 30)  # days
+
+Garment = Tuple[str, str]  # (type, color), as normalize_item returns them
+
+
+def worn_pieces(outfits) -> List[dict]:
+    """Garments of one outfit or a list of outfits (nested lists are flattened)."""
+    pieces = []
+    for piece in outfits or []:
+        if isinstance(piece, list):
+            pieces.extend(worn_pieces(piece))
+        elif isinstance(piece, dict):
+            pieces.append(piece)
+    return pieces
+
+
+def _utc(when: datetime) -> datetime:
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when
+
+
+def _update(outfits, when: datetime) -> Optional[dict]:
+    fields = {}
+    for piece in worn_pieces(outfits):
+        item = normalize_item(piece)
+        fields[garment_attribute(item["type"], item["color"])] = item
+    if not fields:
+        return None
+    update = {"$set": {}, "$max": {"updated_at": when}, "$push": {}}
+    for key, item in fields.items():
+        update["$set"][f"garments.{key}.type"] = item["type"]
+        update["$set"][f"garments.{key}.color"] = item["color"]
+        update["$max"][f"garments.{key}.last_worn"] = when
+        update["$push"][f"garments.{key}.worn"] = {
+            "$each": [when], "$sort": -1, "$slice": MAX_WEARS,
+        }
+    return update
+
+
+def record_wear(username: str, outfits, when: Optional[datetime] = None) -> None:
+    """Fold worn garments into the user's history with a single atomic update."""
+    update = _update(outfits, _utc(when or datetime.now(timezone.utc)))
+    if update is None:
+        return
+    write_behind.update(
+        wear_history_collection.name, {"username": username}, update, upsert=True
+    )
+
+
+def _garments(doc: Optional[dict]) -> Dict[Garment, dict]:
+    history = {}
+    for entry in (doc or {}).get("garments", {}).values():
+        history[(entry["type"], entry["color"])] = {
+            "last_worn": _utc(entry["last_worn"]),
+            # A replayed write may have pushed the same time twice
+            "worn": sorted({_utc(when) for when in entry.get("worn", [])}, reverse=True),
+        }
+    return history
+
+
+def load_wear_history(username: str) -> Dict[Garment, dict]:
+    """
+    Returns:
+    - {(type, color): {"last_worn": datetime, "worn": [datetime, ...] newest first}}
+    """
+    return _garments(wear_history_collection.find_one({"username": username}, {"_id": 0}))
+
+
+def bulk_wear_history(usernames: List[str]) -> Dict[str, Dict[Garment, dict]]:
+    """``load_wear_history`` for many users with a single query."""
+    history = {username: {} for username in usernames}
+    for doc in wear_history_collection.find({"username": {"$in": list(usernames)}}, {"_id": 0}):
+        history[doc["username"]] = _garments(doc)
+    return history
+
+
+def wear_counts(entry: dict,
+                now: Optional[datetime] = None,
+                windows: Tuple[int, ...] = WINDOWS) -> Dict[int, int]:
+    """Times worn in each of the last ``windows`` days (at most MAX_WEARS)."""
+    now = now or datetime.now(timezone.utc)
+    return {
+        days: sum(1 for when in entry["worn"] if when >= now - timedelta(days=days))
+        for days in windows
+    }
+
+
+def rebuild_wear_history(username: Optional[str] = None) -> int:
+    """Rebuild the history from ``recent_outfits``. Returns wear records folded in."""
+    query = {"username": username} if username else {}
+    wear_history_collection.delete_many(query)
+    count = 0
+    for doc in recent_outfits_collection.find(query).sort("timestamp", 1):
+        record_wear(doc["username"], doc.get("outfit"), doc.get("timestamp"))
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    ensure_indexes()
+    count = rebuild_wear_history(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(f"✅ Rebuilt wear history from {count} worn outfit record(s).")
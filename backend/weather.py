@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from telemetry import register_stats
+
+from dotenv import load_dotenv
+load_dotenv()
+
+OPENWEATHERMAP_URL = "https://api.openweathermap.org/data/2.5/weather"
+
+
+class OpenWeatherMapBackend:
+    """
+    Fetches current weather from OpenWeatherMap (or any server speaking the
+    same API, e.g. a local fake in tests) over a pooled HTTP session.
+    """
+
+    def __init__(self,
+                 base_url: Optional[str] = None,
+                 api_key: Optional[str] = None,
+                 timeout: float = 5.0,
+                 pool_size: int = 10):
+        self.base_url = base_url or os.getenv("OPENWEATHERMAP_URL", OPENWEATHERMAP_URL)
+        self.api_key = api_key or os.getenv("OPENWEATHERMAP_API_KEY")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, latitude: float, longitude: float) -> Dict:
+        if not self.api_key:
+            raise ValueError("⚠️ OpenWeatherMap API key is not set in the environment.")
+
+        response = self.session.get(
+            self.base_url,
+            params={
+                "lat": latitude,
+                "lon": longitude,
+                "units": "metric",
+                "appid": self.api_key,
+            },
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        data = response.json()
+        return {
+            "description": data["weather"][0]["description"].capitalize(),
+            "temperature": data["main"]["temp"],
+            "feels_like": data["main"]["feels_like"],
+        }
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WeatherService:
+    """
+    Per-cell weather cache in front of a weather backend.
+
+    Coordinates are snapped to a grid of ``cell_deg`` degrees so nearby users
+    share one cached reading. Entries expire after ``ttl`` seconds and at most
+    ``max_entries`` cells are kept. Concurrent misses for the same cell wait
+    on a single upstream call.
+    """
+
+    def __init__(self,
+                 backend=None,
+                 ttl: float = 600,
+                 max_entries: int = 1024,
+                 cell_deg: float = 0.05):
+        self.backend = backend or OpenWeatherMapBackend()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.cell_deg = cell_deg
+        self._cache = OrderedDict()  # cell -> (weather, expires_at)
+        self._inflight: Dict[Tuple[float, float], _Flight] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.upstream_calls = 0
+
+    def cell(self, latitude: float, longitude: float) -> Tuple[float, float]:
+        """Return the centre of the grid cell containing the coordinates."""
+        size = self.cell_deg
+        return (
+            round((int(latitude // size) + 0.5) * size, 6),
+            round((int(longitude // size) + 0.5) * size, 6),
+        )
+
+    def get(self, latitude: float, longitude: float) -> Dict:
+        cell = self.cell(latitude, longitude)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._cache.get(cell)
+            if entry is not None and entry[1] > now:
+                self._cache.move_to_end(cell)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            flight = self._inflight.get(cell)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[cell] = _Flight()
+                self.upstream_calls += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self.backend.fetch(*cell)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if flight.error is None:
+                    self._cache[cell] = (flight.result, time.monotonic() + self.ttl)
+                    self._cache.move_to_end(cell)
+                    while len(self._cache) > self.max_entries:
+                        self._cache.popitem(last=False)
+                del self._inflight[cell]
+            flight.event.set()
+
+        return flight.result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "upstream_calls": self.upstream_calls,
+            }
+
+
+weather_service = WeatherService(
+    ttl=float(os.getenv("WEATHER_CACHE_TTL", "600")),
+    max_entries=int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "1024")),
+    cell_deg=float(os.getenv("WEATHER_CELL_DEG", "0.05")),
+)
+register_stats("weather_cache", weather_service.stats)
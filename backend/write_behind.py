@@ -0,0 +1,455 @@
+"""
+Write-behind persistence for chat turns and tool writes.
+
+Writes are queued and applied by a background worker in batches
+(``insert_many`` / ``bulk_write`` per collection, one counter update per
+session for chat messages), so request latency does not include Mongo
+round-trips.
+
+Durability:
+- the queue is bounded; when it is full the caller waits for room
+  (backpressure, no loss). Writes are always applied in the order they were
+  queued, so e.g. a session insert lands before the messages appended to it
+- pending writes are flushed on interpreter shutdown
+- with WRITE_BEHIND_JOURNAL set, every queued write is appended to a local
+  journal first and replayed by the worker on the next start (before new
+  writes, with the same retries) if the process died before the worker
+  committed it. Inserts carry client-side ids and message appends
+  carry a turn id, so replays skip what already landed; ``$inc`` updates
+  (e.g. preference counters) are at-least-once.
+
+Set WRITE_BEHIND=0 to write synchronously everywhere.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from bson import ObjectId, json_util
+from pymongo import InsertOne, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from db import db, sessions_collection, messages_collection
+from telemetry import register_stats
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("WRITE_BEHIND", "1") != "0"
+MAX_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500"))
+FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.05"))
+ENQUEUE_TIMEOUT = float(os.getenv("WRITE_BEHIND_ENQUEUE_TIMEOUT", "0.5"))
+JOURNAL_PATH = os.getenv("WRITE_BEHIND_JOURNAL")
+JOURNAL_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "0") == "1"
+MAX_RETRIES = 3
+# How long a read waits for the user's own queued writes before going ahead
+FLUSH_USER_TIMEOUT = 0.5
+
+DUPLICATE_KEY = 11000
+
+
+class Journal:
+    """
+    Append-only log of queued writes plus a checkpoint below which every
+    record is known to be committed. The log is truncated whenever nothing
+    is outstanding.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.checkpoint_path = path + ".checkpoint"
+        self.failed_path = path + ".failed"
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._outstanding = set()
+        self._file = None
+
+    def pending(self) -> List[dict]:
+        """Records a previous process wrote but may not have committed."""
+        if not os.path.exists(self.path):
+            return []
+        committed = -1
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                committed = int(f.read().strip() or -1)
+        records = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json_util.loads(line)
+                except ValueError:
+                    break  # torn final line from a crash
+                if record["id"] > committed:
+                    records.append(record)
+        return records
+
+    def open(self) -> None:
+        self._file = open(self.path, "a", encoding="utf-8")
+        with self._lock:
+            self._truncate()
+
+    def append(self, op: dict) -> int:
+        with self._lock:
+            record_id = self._next_id
+            self._next_id += 1
+            self._outstanding.add(record_id)
+            self._file.write(json_util.dumps({"id": record_id, "op": op}) + "\n")
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            return record_id
+
+    def commit(self, record_ids) -> None:
+        with self._lock:
+            self._outstanding.difference_update(record_ids)
+            if not self._outstanding:
+                self._truncate()
+                return
+            with open(self.checkpoint_path, "w", encoding="utf-8") as f:
+                f.write(str(min(self._outstanding) - 1))
+
+    def _truncate(self) -> None:
+        self._file.seek(0)
+        self._file.truncate()
+        self._next_id = 0
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def dead_letter(self, ops: List[dict]) -> None:
+        with open(self.failed_path, "a", encoding="utf-8") as f:
+            for op in ops:
+                f.write(json_util.dumps(op) + "\n")
+
+
+def _owner(op: dict) -> Optional[str]:
+    """Whose write this is, for ``flush_user``."""
+    if op["kind"] == "insert":
+        return op["doc"].get("username") or op["doc"].get("user_id")
+    if op["kind"] == "update":
+        return op["filter"].get("username", op["filter"].get("_id"))
+    return str(op["session_id"])
+
+
+class WriteBehindQueue:
+    def __init__(self,
+                 enabled: bool = ENABLED,
+                 max_size: int = MAX_QUEUE_SIZE,
+                 batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL,
+                 journal: Optional[Journal] = None):
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.journal = journal
+        self._queue: queue.Queue = queue.Queue(maxsize=max_size)
+        self._idle = threading.Condition()
+        self._outstanding = defaultdict(int)  # owner -> queued, unwritten ops
+        self._replaying = 0  # journaled ops from a previous process not yet replayed
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.enqueued = 0
+        self.written = 0
+        self.backpressure_waits = 0
+        self.failures = 0
+
+    # ---- public API -------------------------------------------------------
+
+    def insert(self, collection: str, doc: dict) -> ObjectId:
+        """Queue an insert; the document gets a client-side ``_id``."""
+        doc.setdefault("_id", ObjectId())
+        self._submit({"kind": "insert", "collection": collection, "doc": doc})
+        return doc["_id"]
+
+    def insert_many(self, collection: str, docs: List[dict]) -> None:
+        for doc in docs:
+            self.insert(collection, doc)
+
+    def update(self, collection: str, filter: dict, update: dict, upsert: bool = False) -> None:
+        self._submit({
+            "kind": "update",
+            "collection": collection,
+            "filter": filter,
+            "update": update,
+            "upsert": upsert,
+        })
+
+    def append_messages(self, session_id: str, messages: List[dict]) -> None:
+        """Queue chat messages; sequence numbers are allocated at write time."""
+        now = datetime.now(timezone.utc)
+        self._submit({
+            "kind": "append",
+            "session_id": ObjectId(session_id),
+            "turn_id": ObjectId(),
+            "messages": [
+                {
+                    "role": m["role"],
+                    "content": m["content"],
+                    "timestamp": m.get("timestamp", now),
+                }
+                for m in messages
+            ],
+        })
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything queued so far is written."""
+        if not self.enabled or self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._queue.unfinished_tasks or self._replaying:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def flush_user(self, owner: str, timeout: Optional[float] = FLUSH_USER_TIMEOUT) -> bool:
+        """
+        Block until the writes queued for ``owner`` (a username, or a session
+        id for message appends) are written; other users' backlog isn't awaited.
+        """
+        if not self.enabled or self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._outstanding.get(owner):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def start(self) -> None:
+        if not self.enabled or self._thread is not None:
+            return
+        replay = []
+        if self.journal:
+            pending = self.journal.pending()
+            self.journal.open()
+            # Journaled again so they survive another crash until replayed
+            replay = [(self.journal.append(record["op"]), record["op"]) for record in pending]
+            if replay:
+                logger.info("Replaying %d journaled write(s)", len(replay))
+        with self._idle:
+            for _, op in replay:
+                self._outstanding[_owner(op)] += 1
+            self._replaying = len(replay)
+        # The worker replays, so a database that is down at boot doesn't stop the app
+        self._thread = threading.Thread(
+            target=self._run, args=(replay,), name="write-behind", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout: float = 10) -> None:
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "backpressure_waits": self.backpressure_waits,
+            "failures": self.failures,
+        }
+
+    # ---- internals --------------------------------------------------------
+
+    def _submit(self, op: dict) -> None:
+        if not self.enabled or self._thread is None:
+            self._apply([op])
+            return
+        record_id = self.journal.append(op) if self.journal else None
+        owner = _owner(op)
+        with self._idle:
+            self._outstanding[owner] += 1
+        try:
+            self._queue.put((record_id, op), timeout=ENQUEUE_TIMEOUT)
+        except queue.Full:
+            # Backpressure: wait for the worker rather than writing ahead of
+            # ops queued earlier (an append must not overtake its session)
+            self.backpressure_waits += 1
+            logger.warning("Write-behind queue full; waiting for the worker")
+            self._queue.put((record_id, op))
+        self.enqueued += 1
+
+    def _run(self, replay: List[tuple] = ()) -> None:
+        for start in range(0, len(replay), self.batch_size):
+            batch = replay[start:start + self.batch_size]
+            self._write(batch, replay=True)
+            with self._idle:
+                self._replaying -= len(batch)
+                self._idle.notify_all()
+
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._write(batch)
+            with self._idle:
+                for _ in batch:
+                    self._queue.task_done()
+                self._idle.notify_all()
+
+    def _write(self, batch: List[tuple], replay: bool = False) -> None:
+        """Apply a batch of (record id, op) with retries; failures are dead-lettered."""
+        ops = [op for _, op in batch]
+        done = set()
+        for attempt in range(MAX_RETRIES):
+            try:
+                # Retries skip ops known to be written and check appends
+                # by turn id, so $inc updates and messages aren't doubled
+                self._apply(ops, replay=replay or attempt > 0, done=done)
+                break
+            except PyMongoError as e:
+                logger.warning("Write-behind batch failed (attempt %d): %s", attempt + 1, e)
+                time.sleep(0.1 * 2 ** attempt)
+            except Exception:
+                # Not a database hiccup (e.g. an unencodable document); don't retry
+                logger.exception("Write-behind batch failed")
+                break
+        if len(done) < len(ops):
+            failed = [op for index, op in enumerate(ops) if index not in done]
+            self.failures += len(failed)
+            logger.error("Write-behind dropped %d write(s): %r", len(failed), failed)
+            if self.journal:
+                self.journal.dead_letter(failed)
+
+        if self.journal:
+            self.journal.commit([r for r, _ in batch])
+
+        with self._idle:
+            for _, op in batch:
+                owner = _owner(op)
+                self._outstanding[owner] -= 1
+                if not self._outstanding[owner]:
+                    del self._outstanding[owner]
+
+    def _apply(self, ops: List[dict], replay: bool = False, done: Optional[set] = None) -> None:
+        """
+        Write ``ops`` grouped per collection. Indexes of ops known to be
+        written are added to ``done``; ops already in it are skipped.
+        """
+        done = set() if done is None else done
+        inserts = defaultdict(list)
+        updates = defaultdict(list)
+        appends = []
+        for index, op in enumerate(ops):
+            if index in done:
+                continue
+            if op["kind"] == "insert":
+                inserts[op["collection"]].append(index)
+            elif op["kind"] == "update":
+                updates[op["collection"]].append(index)
+            elif op["kind"] == "append":
+                appends.append(index)
+
+        for collection, indexes in inserts.items():
+            try:
+                db[collection].bulk_write(
+                    [InsertOne(ops[i]["doc"]) for i in indexes], ordered=False
+                )
+            except BulkWriteError as e:
+                # Replayed inserts that already landed are fine
+                errors = e.details.get("writeErrors", [])
+                if any(err.get("code") != DUPLICATE_KEY for err in errors):
+                    raise
+            done.update(indexes)
+            self.written += len(indexes)
+        for collection, indexes in updates.items():
+            try:
+                db[collection].bulk_write(
+                    [
+                        UpdateOne(ops[i]["filter"], ops[i]["update"], upsert=ops[i]["upsert"])
+                        for i in indexes
+                    ],
+                    ordered=True,
+                )
+            except BulkWriteError as e:
+                # Ordered: every update before the failed one was applied
+                applied = indexes[:e.details["writeErrors"][0]["index"]]
+                done.update(applied)
+                self.written += len(applied)
+                raise
+            done.update(indexes)
+            self.written += len(indexes)
+        if appends:
+            self._apply_appends([ops[i] for i in appends], replay)
+            done.update(appends)
+            self.written += len(appends)
+
+    def _apply_appends(self, appends: List[dict], replay: bool) -> None:
+        by_session = defaultdict(list)
+        for op in appends:
+            if replay and messages_collection.find_one({"turn_id": op["turn_id"]}, {"_id": 1}):
+                continue
+            by_session[op["session_id"]].append(op)
+
+        docs = []
+        for session_id, ops in by_session.items():
+            count = sum(len(op["messages"]) for op in ops)
+            seq = self._reserve_seqs(session_id, count)
+            if seq is None:
+                logger.error("Dropping messages for missing session %s", session_id)
+                continue
+            for op in ops:
+                for message in op["messages"]:
+                    docs.append({
+                        "session_id": session_id,
+                        "seq": seq,
+                        "turn_id": op["turn_id"],
+                        **message,
+                    })
+                    seq += 1
+        if docs:
+            messages_collection.insert_many(docs, ordered=False)
+
+    def _reserve_seqs(self, session_id: ObjectId, count: int) -> Optional[int]:
+        """Allocate ``count`` message seqs; returns the first, or None if the session is gone."""
+        for _ in range(2):
+            session = sessions_collection.find_one_and_update(
+                {"_id": session_id, "message_count": {"$exists": True}},
+                {
+                    "$inc": {"message_count": count},
+                    "$set": {"updated_at": datetime.now(timezone.utc)},
+                },
+                projection={"message_count": 1},
+                return_document=ReturnDocument.AFTER,
+            )
+            if session is not None:
+                return session["message_count"] - count
+            # A session from before chat_messages: number new messages after
+            # its embedded ones, which migrate_messages.py moves to seq 0..n-1
+            legacy = sessions_collection.find_one({"_id": session_id}, {"messages": 1})
+            if legacy is None:
+                return None
+            sessions_collection.update_one(
+                {"_id": session_id, "message_count": {"$exists": False}},
+                {"$set": {"message_count": len(legacy.get("messages") or [])}},
+            )
+        return None
+
+
+write_behind = WriteBehindQueue(
+    journal=Journal(JOURNAL_PATH, JOURNAL_FSYNC) if JOURNAL_PATH else None
+)
+register_stats("write_behind", write_behind.stats)
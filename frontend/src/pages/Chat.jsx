@@ -90,27 +90,83 @@ function Chat() {
     setLoading(true)
 
     try {
-      const response = await axios.post('http://localhost:5000/chat', {
-        message: newMessage,
-        session_id: sessionId,
-        location: location
-      }, {
+      const response = await fetch('http://localhost:5000/chat/stream', {
+        method: 'POST',
         headers: {
+          'Content-Type': 'application/json',
           Authorization: `Bearer ${localStorage.getItem('token')}`
-        }
+        },
+        body: JSON.stringify({
+          message: newMessage,
+          session_id: sessionId,
+          location: location
+        })
       })
 
-      if (response.data.session_id) {
-        setSessionId(response.data.session_id)
+      if (!response.ok || !response.body) {
+        throw new Error(`Request failed with status ${response.status}`)
       }
 
       const botMessage = {
-        text: response.data.response,
+        text: '',
         sender: 'bot',
         timestamp: new Date().toISOString()
       }
+      let started = false
 
-      setMessages(prev => [...prev, botMessage])
+      const updateBotMessage = (text) => {
+        if (!started) {
+          started = true
+          setLoading(false)
+          setMessages(prev => [...prev, { ...botMessage, text }])
+          return
+        }
+        setMessages(prev => [
+          ...prev.slice(0, -1),
+          { ...prev[prev.length - 1], text }
+        ])
+      }
+
+      const handleEvent = (event, payload) => {
+        if (event === 'session') {
+          setSessionId(payload.session_id)
+        } else if (event === 'token') {
+          botMessage.text += payload.content
+          updateBotMessage(botMessage.text)
+        } else if (event === 'tool_call') {
+          // The reply after a tool call replaces anything streamed before it
+          botMessage.text = ''
+        } else if (event === 'done') {
+          botMessage.text = payload.response
+          updateBotMessage(botMessage.text)
+        } else if (event === 'error') {
+          throw new Error(payload.message)
+        }
+      }
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        let boundary
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const raw = buffer.slice(0, boundary)
+          buffer = buffer.slice(boundary + 2)
+
+          let event = 'message'
+          let data = ''
+          for (const line of raw.split('\n')) {
+            if (line.startsWith('event:')) event = line.slice(6).trim()
+            else if (line.startsWith('data:')) data += line.slice(5).trim()
+          }
+          if (data) handleEvent(event, JSON.parse(data))
+        }
+      }
     } catch (error) {
       console.error('Error sending message:', error)
       const errorMessage = {